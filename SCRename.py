@@ -2,17 +2,22 @@
 # SCRename (python) Ver. 6.0
 
 # python 3.7以降
+# 起動を速くするため、通信・常駐・監視でのみ使うモジュールは使用時に import する
 import os
 import sys
 import time
 import re
+import bisect
 import datetime
-import urllib.request
+import functools
+import io
+import json
+import sqlite3
+import threading
 import urllib.parse
-import xml.etree.ElementTree as ET
-from pathlib import Path
-from typing import List, Tuple, Optional
-from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Tuple, Optional
+from dataclasses import asdict, dataclass, fields
+from contextlib import contextmanager
 
 # 定数定義
 SEP = "_"
@@ -26,6 +31,43 @@ CHAR8 = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X"]
 CHAR9 = ["quot", "amp", "#039", "lt", "gt"]
 CHAR10 = ["\"", "&", "'", "＜", "＞"]
 CHAR11 = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
+WEEK1 = ["月", "火", "水", "木", "金", "土", "日"]
+WEEK2 = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+RSS_MAX_DAYS = 8  # rss2.php 1回あたりの最大取得日数
+DB_FILE = "SCRename.db"              # 応答キャッシュ・TIDデータベース
+CACHE_MAX_ENTRIES = 5000             # キャッシュ最大件数
+CACHE_MAX_BYTES = 64 * 1024 * 1024   # キャッシュ最大サイズ
+CACHE_TTL_PAST = 30 * 86400          # 放送済みの番組情報の有効期間（秒）
+CACHE_TTL_FUTURE = 3600              # 未放送を含む番組情報の有効期間（秒）
+CACHE_TTL_FIND = 86400               # タイトル検索結果の有効期間（秒）
+MAX_WORKERS = 4                      # 一括処理時の同時検索数
+RATE_LIMIT = 1.0                     # 同一ホストへの1秒あたりのリクエスト数
+RATE_BURST = 2                       # 同一ホストへの連続リクエスト数
+HTTP_CONNECT_TIMEOUT = 10            # 接続タイムアウト（秒）
+HTTP_READ_TIMEOUT = 30               # 受信タイムアウト（秒）
+HTTP_TOTAL_TIMEOUT = 120             # 1リクエストあたりの最大時間（秒）
+HTTP_MAX_REDIRECTS = 5               # リダイレクトの最大回数
+SOCKET_FILE = "SCRename.sock"        # 常駐モードの待ち受けソケット
+RETRY_ATTEMPTS = 3                   # 通信エラー時の最大試行回数
+RETRY_BASE_DELAY = 1.0               # 再試行までの待ち時間の基準（試行ごとに倍）
+RETRY_MAX_DELAY = 10.0               # 再試行までの待ち時間の上限
+BREAKER_THRESHOLD = 3                # 接続を止めるまでの連続エラー回数（再試行しても取得できなかった回数）
+BREAKER_COOLDOWN = 300               # 連続エラー後に接続を止める秒数
+LOCK_DIR = "SCRename.lock"           # 同じURLの同時取得を1回にまとめるためのロックファイルのフォルダ
+LOCK_BUCKETS = 64                    # ロックファイルの数（URLのハッシュで振り分け）
+RETRY_FILE = "SCRename.retry"        # オフラインで処理できなかったファイルの一覧
+PREFETCH_KEEP = 86400                # 先読みした番組情報を録画開始から保持する秒数
+EPISODE_LISTS_MAX = 256              # メモリに保持する全話の放送情報の最大件数（TID・放送局ごと）
+SIMILAR_TITLES = 3                   # TIDが見つからない場合に表示する似たタイトルの数
+MOVE_WORKERS = 2                     # 一括処理時に同時に移動するファイル数
+MOVE_CHUNK = 64 * 1024 * 1024        # 別ドライブへのコピー1回あたりのバイト数
+MOVE_PROGRESS = 5                    # 別ドライブへのコピーの進捗を表示する間隔（秒）
+MOVE_PART_SUFFIX = ".part"           # 別ドライブへのコピー中のファイル名に付ける拡張子
+WATCH_EXTENSIONS = (".ts",)          # 監視モードでリネーム対象とする拡張子
+WATCH_DEBOUNCE = 5                   # 監視モードで最後の書き込み完了から処理開始までの秒数
+WATCH_QUIET = 10                     # 監視モードで書き込み完了とみなす無更新の秒数
+SCAN_EXTENSIONS = (".ts", ".m2ts", ".mp4", ".mkv")  # フォルダ指定時にリネーム対象とする拡張子
+SCAN_BATCH = 200                     # フォルダ指定時に1回の一括処理で扱うファイル数
 
 @dataclass
 class RenameOptions:
@@ -38,6 +80,22 @@ class RenameOptions:
     recursive_search: bool = False # -a1 オプション: 再帰的検索
     start_pos: int = 0            # タイトル開始位置
     search_len: int = 4           # タイトル検索文字数
+    trace: str = ""               # -j オプション: 処理段階ごとの計測結果の出力先（"-" は標準エラー出力）
+    sync_move: bool = False       # -y オプション: 別ドライブへの移動時にディスクへの書き込み完了を待つ
+
+@dataclass
+class FileContext:
+    """番組検索前のファイル解析結果を保持するデータクラス"""
+    file_path: str                 # 処理対象ファイルのパス
+    rpath: str                     # ファイルのあるフォルダ
+    filename: str                  # 拡張子を除いたファイル名
+    ext: str                       # 拡張子
+    tgtdt: datetime.datetime       # 検索基準日時
+    dtflag: int                    # 1: 開始日時 0: 終了日時
+    days: int                      # 遡って検索する日数
+    normalized_title: str          # 半角変換後のタイトル
+    main_title: str                # 検索用タイトル
+    serv: int                      # 放送局番号
 
 def get_file_info(file_path: str) -> Tuple[str, str, str]:
     """ファイルパス、ファイル名、拡張子、タイトル開始位置を取得"""
@@ -54,8 +112,8 @@ def get_file_info(file_path: str) -> Tuple[str, str, str]:
     
     return rpath, name, ext
 
-def get_date_from_title(title: str, pos: int) -> Tuple[Optional[datetime.datetime], int, int, int]:
-    """タイトルから日付を取得"""
+def get_date_from_title(title: str, pos: int, file_stat: Optional[Callable[[], os.stat_result]] = None) -> Tuple[Optional[datetime.datetime], int, int, int]:
+    """タイトルから日付を取得（日時がない場合は file_stat で取得したファイルの作成・更新日時を使う）"""
     tgtdt = None
     dtflag = 0
     days = 1
@@ -114,10 +172,15 @@ def get_date_from_title(title: str, pos: int) -> Tuple[Optional[datetime.datetim
             except ValueError:
                 pass
     
-    if dtflag == 0 and Path(title).exists():
-        file_path = Path(title)
-        dt1 = datetime.datetime.fromtimestamp(file_path.stat().st_ctime)
-        dt2 = datetime.datetime.fromtimestamp(file_path.stat().st_mtime)
+    st = None
+    if dtflag == 0 and file_stat is not None:
+        try:
+            st = file_stat()
+        except OSError:
+            pass
+    if st is not None:
+        dt1 = datetime.datetime.fromtimestamp(st.st_ctime)
+        dt2 = datetime.datetime.fromtimestamp(st.st_mtime)
         if dt1 < dt2:
             dt2 = dt1
             dtflag = 1
@@ -160,7 +223,6 @@ def remove_leading_chars(title: str) -> str:
         if i >= len(title):
             print(title)
             print("タイトルを取得出来ませんでした。", file=sys.stderr)
-            time.sleep(1)
             sys.exit(1)
     
     return title[i:]
@@ -205,8 +267,50 @@ def get_title(ftitle: str, search_len: int = 4) -> str:
     
     return title
 
+class ServiceTable(list):
+    """SCRename.srv の内容（リストとして扱える）と検索用の索引"""
+
+    def __init__(self, rows: List[List[str]]) -> None:
+        super().__init__(rows)
+        self.matchers = {}
+        self.chids: Dict[str, int] = {}  # ChID → 最初に定義された放送局番号
+        for i, serv_info in enumerate(self):
+            if len(serv_info) > 3:
+                self.chids.setdefault(serv_info[3], i)
+
+    def matcher(self, column: int, ignore_case: bool):
+        """列の全放送局名を定義順に並べた正規表現を取得"""
+        key = (column, ignore_case)
+        if key not in self.matchers:
+            names: Dict[str, int] = {}
+            for i, serv_info in enumerate(self):
+                name = serv_info[column].upper() if ignore_case else serv_info[column]
+                names.setdefault(name, i)
+            # 先読みで全位置を調べ、各位置では定義順が最も早い放送局名に一致させる
+            pattern = re.compile("(?=(" + "|".join(map(re.escape, names)) + "))") if names else None
+            self.matchers[key] = (pattern, names)
+        return self.matchers[key]
+
+    def find(self, column: int, text: str, ignore_case: bool = True) -> int:
+        """text に含まれる放送局名のうち定義順が最も早いものの番号を取得（なければ -1）"""
+        pattern, names = self.matcher(column, ignore_case)
+        if pattern is None:
+            return -1
+        if ignore_case:
+            text = text.upper()
+        return min((names[m.group(1)] for m in pattern.finditer(text)), default=-1)
+
+    def find_chid(self, ch_id: str, default: int = -1) -> int:
+        """ChIDから放送局番号を取得"""
+        return self.chids.get(ch_id, default)
+
+def as_service_table(service: List[List[str]]) -> ServiceTable:
+    """放送局一覧を ServiceTable として取得"""
+    return service if isinstance(service, ServiceTable) else ServiceTable(service)
+
 def get_service(ftitle: str, title: str, service: List[List[str]], pos: int) -> int:
     """放送局名を取得"""
+    table = as_service_table(service)
     serv = -1
     sep_pos = ftitle.rfind(SEP)
     
@@ -217,19 +321,9 @@ def get_service(ftitle: str, title: str, service: List[List[str]], pos: int) ->
     
     service_part = ftitle[sep_pos + 1:]
     
-    for i in range(4):
-        j = 0 if i < 2 else 2
-        
-        for serv_idx, serv_info in enumerate(service):
-            if i in [0, 2]:
-                k = service_part.upper().rfind(serv_info[j].upper())
-            else:
-                k = ftitle.upper().rfind(serv_info[j].upper())
-            
-            if k >= 0:
-                serv = serv_idx
-                break
-        
+    # 放送局部分、ファイル名全体の順に1列目、3列目の放送局名を検索
+    for column, text in ((0, service_part), (0, ftitle), (2, service_part), (2, ftitle)):
+        serv = table.find(column, text)
         if serv >= 0:
             break
     
@@ -238,153 +332,221 @@ def get_service(ftitle: str, title: str, service: List[List[str]], pos: int) ->
     
     return serv
 
-def search_program_info(html: str, title: str, serv: int, service: List[List[str]], tgtdt: datetime.datetime, dtflag: int) -> Tuple[Optional[str], Optional[str], Optional[int], Optional[datetime.datetime], Optional[datetime.datetime]]:
-    """番組情報を検索して取得"""
-    # <item>タグ以降を取得
-    item_start = html.find("<item>")
-    if item_start >= 0:
-        html = html[item_start + 6:]
-    
-    # エスケープ文字の処理
-    html = html.replace("\\", "＼")
-    
-    # HTMLエンティティの処理
-    for i in range(len(CHAR9)):
-        html = html.replace(f"&{CHAR9[i]};", CHAR10[i])
-    
-    # 番組情報検索
-    pos = 0
-    stdt = None
-    eddt = None
-    
-    # タイトルと放送局名で検索
-    i = html.find("<title>")
+@dataclass
+class ProgramEntry:
+    """番組表の1番組分の情報"""
+    index: int                     # 番組表内の順番
+    title: str                     # 番組名
+    channel: str                   # 放送局名
+    subtitle_info: str             # 話数・サブタイトル部分
+    start: Optional[datetime.datetime]
+    end: Optional[datetime.datetime]
+
+def make_program_entry(index: int, text: str, pub_date: str) -> Optional[ProgramEntry]:
+    """番組表の <title>（番組名|放送局名|終了時刻|話数・サブタイトル）と <pubDate> から番組情報を作成"""
+    j = text.find("|", 1)
+    if j < 0:
+        return None
+    k = text.find("|", j + 1)
+    l = text.find("|", k + 1) if k >= 0 else -1
+    channel = text[j+1:k] if k >= 0 else text[j+1:]
+    subtitle_info = text[l+1:] if l >= 0 else ""
+
+    # 日付情報の取得
+    n = pub_date.find("+", 10)
+    date_str = pub_date[:n] if n >= 0 else pub_date
+    dt1 = None
+    dt2 = None
+    if "T" in date_str:
+        try:
+            dt1 = datetime.datetime.fromisoformat(date_str)
+        except ValueError:
+            pass
+
+    # 終了時刻の取得
+    if dt1 and k >= 0:
+        time_str = text[k+1:k+6]
+        try:
+            dt2 = datetime.datetime.combine(dt1.date(), datetime.time(int(time_str[:2]), int(time_str[3:])))
+            if dt1 >= dt2:
+                dt2 = dt2 + datetime.timedelta(days=1)
+        except ValueError:
+            pass
+
+    return ProgramEntry(index, text[:j], channel, subtitle_info, dt1, dt2)
+
+def decode_feed_text(raw: bytes) -> str:
+    """番組表の項目を文字列に変換し、エスケープ文字とHTMLエンティティを処理"""
+    text = raw.decode("utf-8", "replace")
+    if "\\" in text:
+        text = text.replace("\\", "＼")
+    if "&" in text:
+        for i in range(len(CHAR9)):
+            text = text.replace(f"&{CHAR9[i]};", CHAR10[i])
+    return text
+
+def iter_feed_entries(data: bytes):
+    """rss2.php の応答を <item> ごとに走査して番組情報を返す
+
+    応答全体を文字列に変換・置換せず、番組ごとに <title> と <pubDate> の部分だけを変換する。
+    """
+    i = data.find(b"<item>")
+    if i < 0:
+        return
+    index = 0
+    i = data.find(b"<title>", i + 6)
     while i >= 0:
         i += 7
-        j = html.find("|", i + 1)
-        if j < 0:
+        m = data.find(b"</title>", i)
+        if m < 0:
             break
-        
-        if title.upper() in html[i:j].upper():
-            k = html.find("|", j + 1)
-            if serv < 0:
-                j = -1
-            elif service[serv][1].upper() in html[j+1:k].upper():
-                j = -1
-            
-            if j == -1:
-                # 日付情報の取得
-                j = html.find("<pubDate>", k + 1) + 9
-                date_str = html[j:html.find("+", j + 10)]
-                t_pos = date_str.find("T")
-                if t_pos >= 0:
-                    date_str = date_str[:t_pos] + " " + date_str[t_pos+1:]
-                    try:
-                        dt1 = datetime.datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
-                        date_str = date_str[:t_pos]
-                    except ValueError:
-                        dt1 = None
-                        date_str = ""
-                else:
-                    dt1 = None
-                    date_str = ""
-                
-                # 終了時刻の取得
-                time_str = date_str + html[k+1:k+6]
-                try:
-                    dt2 = datetime.datetime.strptime(time_str, "%Y-%m-%d %H:%M")
-                    if dt1 and dt1 >= dt2:
-                        dt2 = dt2 + datetime.timedelta(days=1)
-                except ValueError:
-                    dt2 = None
-                
-                # 日付の比較
-                if dtflag == 1:
-                    if not stdt or abs((tgtdt - dt1).total_seconds()) < abs((tgtdt - stdt).total_seconds()):
-                        stdt = dt1
-                        eddt = dt2
-                        pos = i
-                else:
-                    if not eddt or abs((tgtdt - dt2).total_seconds()) < abs((tgtdt - eddt).total_seconds()):
-                        stdt = dt1
-                        eddt = dt2
-                        pos = i
-        
-        i = html.find("<title>", i)
+        n = data.find(b"<pubDate>", m)
+        pub_date = data[n+9:data.find(b"<", n + 9)].decode("ascii", "replace") if n >= 0 else ""
+        entry = make_program_entry(index, decode_feed_text(data[i:m]), pub_date)
+        if entry is None:
+            break
+        index += 1
+        yield entry
+        i = data.find(b"<title>", m)
+
+class ProgramSchedule:
+    """rss2.php の番組表を一度だけ解析し、タイトル・放送局ごとに索引化したもの"""
+
+    def __init__(self, entries: List[ProgramEntry]) -> None:
+        self.entries = entries
+        self.titles: Dict[str, List[ProgramEntry]] = {}    # 大文字化した番組名 → 番組
+        self.channels: Dict[str, List[ProgramEntry]] = {}  # 大文字化した放送局名 → 番組
+        for entry in entries:
+            self.titles.setdefault(entry.title.upper(), []).append(entry)
+            self.channels.setdefault(entry.channel.upper(), []).append(entry)
+        self.title_matches: Dict[str, List[str]] = {}
+        self.matches = {}
+
+    @classmethod
+    def parse(cls, data: bytes) -> "ProgramSchedule":
+        """rss2.php の応答を解析"""
+        return cls(list(iter_feed_entries(data)))
+
+    def lookup(self, title: str, channel: str = "") -> Tuple[List[ProgramEntry], List[ProgramEntry]]:
+        """番組名・放送局名（部分一致）に該当する番組を開始順・終了順で取得"""
+        title = title.upper()
+        channel = channel.upper()
+        key = (title, channel)
+        if key not in self.matches:
+            if title not in self.title_matches:
+                self.title_matches[title] = [x for x in self.titles if title in x]
+            entries = [entry for x in self.title_matches[title] for entry in self.titles[x]
+                       if channel in entry.channel.upper()]
+            by_start = sorted((x for x in entries if x.start), key=lambda x: (x.start, x.index))
+            by_end = sorted((x for x in entries if x.end), key=lambda x: (x.end, x.index))
+            self.matches[key] = (by_start, by_end)
+        return self.matches[key]
+
+    def nearest(self, title: str, channel: str, tgtdt: datetime.datetime, dtflag: int, window: Optional[Tuple[datetime.datetime, datetime.datetime]] = None) -> Optional[ProgramEntry]:
+        """基準日時に最も近い番組を取得（同じ差なら番組表の順番が先のもの）"""
+        by_start, by_end = self.lookup(title, channel)
+        entries = by_start if dtflag == 1 else by_end
+        keys = [x.start for x in entries] if dtflag == 1 else [x.end for x in entries]
+        lo, hi = 0, len(entries)
+        if window and dtflag == 1:
+            lo = bisect.bisect_left(keys, window[0])
+            hi = bisect.bisect_left(keys, window[1])
+        pos = bisect.bisect_left(keys, tgtdt, lo, hi)
+
+        def in_window(entry: ProgramEntry) -> bool:
+            return not window or not entry.start or window[0] <= entry.start < window[1]
+
+        def distance(entry: ProgramEntry) -> float:
+            return abs(((entry.start if dtflag == 1 else entry.end) - tgtdt).total_seconds())
+
+        # 基準日時の前後それぞれで最も近い番組を探す
+        best = None
+        for step, i in ((-1, pos - 1), (1, pos)):
+            found = None
+            while lo <= i < hi:
+                if found and keys[i] != found_key:
+                    break
+                entry = entries[i]
+                if in_window(entry) and (found is None or entry.index < found.index):
+                    found = entry
+                    found_key = keys[i]
+                i += step
+            if found and (best is None or (distance(found), found.index) < (distance(best), best.index)):
+                best = found
+        return best
+
+def parse_subtitle_info(subtitle_info: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """話数・サブタイトル部分からサブタイトル、話数、パートを取得"""
+    subtitle = None
+    number = None
+    part = None
     
-    # 番組情報取得
-    if pos > 0:
-        i = html.find("|", pos)
-        program_title = html[pos:i]
-        j = html.find("|", i + 1)
-        
-        # 放送局名の取得
-        if serv < 0:
-            service_name = html[i+1:j]
-            for k, serv_info in enumerate(service):
-                if serv_info[1] in service_name:
-                    serv = k
+    # サブタイトルの解析
+    i = subtitle_info.find("「")
+    if i > 0:
+        if i > 2 and subtitle_info[0] == "#":
+            for j in range(2, i):
+                if subtitle_info[j] == " ":
                     break
-            if serv < 0:
-                serv = 0
-                service[2][0] = service_name
+            number = subtitle_info[1:j]
+        elif i > 1:
+            part = subtitle_info[:i].strip()
         
-        # サブタイトル情報の取得
-        i = html.find("|", j + 1)
-        j = html.find("</title>", i + 1)
-        if i < j - 1:
-            subtitle_info = html[i+1:j]
-            subtitle = None
-            number = None
-            part = None
-            
-            # サブタイトルの解析
-            i = subtitle_info.find("「")
-            if i > 0:
-                if i > 2 and subtitle_info[0] == "#":
-                    for j in range(2, i):
-                        if subtitle_info[j] == " ":
-                            break
-                    number = subtitle_info[1:j]
-                elif i > 1:
-                    part = subtitle_info[:i].strip()
-                
-                subtitle = subtitle_info[i+1:]
-                if subtitle.endswith("」"):
-                    subtitle = subtitle[:-1]
-            elif subtitle_info.startswith("#"):
-                i = 1
-                number_parts = []
-                subtitle_parts = []
-                
-                while True:
-                    j = subtitle_info.find(" ", i + 1)
-                    if j < 0:
-                        number_parts.append(subtitle_info[i:])
-                        break
-                    else:
-                        number_parts.append(subtitle_info[i:j])
-                        i = subtitle_info.find(" / #", j)
-                        if i < 0:
-                            if j < len(subtitle_info):
-                                subtitle_parts.append(subtitle_info[j+1:].strip())
-                            break
-                        elif i > j + 1:
-                            subtitle_parts.append(subtitle_info[j+1:i-j-1].strip())
-                    i += 3
-                
-                number = ",".join(number_parts)
-                if subtitle_parts:
-                    subtitle = " ／ ".join(subtitle_parts)
+        subtitle = subtitle_info[i+1:]
+        if subtitle.endswith("」"):
+            subtitle = subtitle[:-1]
+    elif subtitle_info.startswith("#"):
+        i = 1
+        number_parts = []
+        subtitle_parts = []
+        
+        while True:
+            j = subtitle_info.find(" ", i + 1)
+            if j < 0:
+                number_parts.append(subtitle_info[i:])
+                break
             else:
-                part = subtitle_info
-            
-            if number:
-                number = "#" + number
-            
-            return program_title, subtitle, serv, stdt, eddt, number
+                number_parts.append(subtitle_info[i:j])
+                i = subtitle_info.find(" / #", j)
+                if i < 0:
+                    if j < len(subtitle_info):
+                        subtitle_parts.append(subtitle_info[j+1:].strip())
+                    break
+                elif i > j + 1:
+                    subtitle_parts.append(subtitle_info[j+1:i-j-1].strip())
+            i += 3
+        
+        number = ",".join(number_parts)
+        if subtitle_parts:
+            subtitle = " ／ ".join(subtitle_parts)
+    else:
+        part = subtitle_info
+    
+    if number:
+        number = "#" + number
     
-    return None, None, serv, stdt, eddt, None
+    return subtitle, number, part
+
+def search_schedule(schedule: ProgramSchedule, title: str, serv: int, service: List[List[str]], tgtdt: datetime.datetime, dtflag: int, window: Optional[Tuple[datetime.datetime, datetime.datetime]] = None) -> Tuple[Optional[str], Optional[str], Optional[int], Optional[datetime.datetime], Optional[datetime.datetime]]:
+    """解析済みの番組表から番組情報を検索して取得"""
+    channel = service[serv][1] if serv >= 0 else ""
+    entry = schedule.nearest(title, channel, tgtdt, dtflag, window)
+    if entry is None:
+        return None, None, serv, None, None, None
+    
+    # 放送局名の取得（放送局一覧にない場合は先頭の放送局とする）
+    if serv < 0:
+        serv = max(as_service_table(service).find(1, entry.channel, ignore_case=False), 0)
+    
+    if not entry.subtitle_info:
+        return None, None, serv, entry.start, entry.end, None
+    
+    subtitle, number, _ = parse_subtitle_info(entry.subtitle_info)
+    return entry.title, subtitle, serv, entry.start, entry.end, number
+
+def search_program_info(data: bytes, title: str, serv: int, service: List[List[str]], tgtdt: datetime.datetime, dtflag: int, window: Optional[Tuple[datetime.datetime, datetime.datetime]] = None) -> Tuple[Optional[str], Optional[str], Optional[int], Optional[datetime.datetime], Optional[datetime.datetime]]:
+    """番組情報を検索して取得（window指定時は開始日時がその範囲の番組のみ対象）"""
+    return search_schedule(ProgramSchedule.parse(data), title, serv, service, tgtdt, dtflag, window)
 
 def extract_episode_number(title: str) -> Tuple[Optional[int], Optional[str]]:
     """ファイル名から話数を抽出"""
@@ -415,41 +577,794 @@ def extract_episode_number(title: str) -> Tuple[Optional[int], Optional[str]]:
     
     return k, title
 
-def get_tid_from_cache(title: str, title2: str) -> Tuple[Optional[int], Optional[str]]:
-    """SCRename.tidファイルからTIDを取得"""
-    tid_path = os.path.join(os.path.dirname(sys.argv[0]), "SCRename.tid")
-    if not os.path.exists(tid_path):
-        return None, title
-    
-    with open(tid_path, "r", encoding="utf-8") as f:
-        for line in f:
-            parts = line.strip().split(",", 1)
-            if len(parts) == 2:
-                tid_title, tid_id = parts
-                if tid_title.replace(" ", "").upper().startswith(title2):
-                    print("SCRename.tid から", end="", file=sys.stderr)
-                    return int(tid_id), tid_title
-    
-    return None, title
+def normalize_url(url: str) -> str:
+    """キャッシュキー用にURLを正規化"""
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
+
+def get_feed_ttl(end: datetime.datetime) -> float:
+    """end までの番組表のキャッシュ有効期間を取得（前日以前に終わった番組表は変更されないものとして扱う）"""
+    return CACHE_TTL_PAST if end < datetime.datetime.now() - datetime.timedelta(days=1) else CACHE_TTL_FUTURE
+
+def get_cache_ttl(url: str, body: bytes) -> float:
+    """エンドポイントと内容に応じたキャッシュ有効期間を取得"""
+    parts = urllib.parse.urlsplit(url)
+    query = dict(urllib.parse.parse_qsl(parts.query))
+    # 前日以前に終わった番組表は変更されないものとして扱う
+    limit = datetime.datetime.now() - datetime.timedelta(days=1)
+    if parts.path.endswith("/rss2.php"):
+        try:
+            start = datetime.datetime.strptime(query.get("start", "")[:8], "%Y%m%d")
+            end = start + datetime.timedelta(days=int(query.get("days", "1")))
+        except ValueError:
+            return CACHE_TTL_FUTURE
+        return get_feed_ttl(end)
+    if parts.path.endswith("/db.php"):
+        times = re.findall(rb"<EdTime>([^<]+)</EdTime>", body)
+        if not times:
+            return CACHE_TTL_FUTURE
+        try:
+            end = max(datetime.datetime.strptime(t.decode("ascii", "replace"), "%Y-%m-%d %H:%M:%S") for t in times)
+        except ValueError:
+            return CACHE_TTL_FUTURE
+        return CACHE_TTL_PAST if end < limit else CACHE_TTL_FUTURE
+    return CACHE_TTL_FIND
+
+def open_database(path: str) -> sqlite3.Connection:
+    """SCRename.db を開く（WAL のチェックポイント時のみ fsync し、停電でもデータベースが壊れないようにする）"""
+    db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+class ResponseCache:
+    """しょぼいカレンダーの応答を SQLite に保存するキャッシュ（LRUで削除）"""
+
+    def __init__(self, path: str, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = open_database(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        # 日ごとの番組表も応答と同じ上限・LRUで削除する（size・accessed のない旧形式の表は作り直す）
+        columns = [x[1] for x in self.db.execute("PRAGMA table_info(feed_days)")]
+        if columns and "accessed" not in columns:
+            self.db.execute("DROP TABLE feed_days")
+        self.db.execute("CREATE TABLE IF NOT EXISTS feed_days (day TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS feed_days_accessed ON feed_days (accessed)")
+        self.db.commit()
+
+    def get(self, url: str, count_miss: bool = True) -> Optional[bytes]:
+        """有効期間内のキャッシュを取得"""
+        key = normalize_url(url)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT body FROM responses WHERE url = ? AND expires > ?", (key, now)).fetchone()
+            if row is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self.db.execute("UPDATE responses SET accessed = ? WHERE url = ?", (now, key))
+            self.db.commit()
+            self.hits += 1
+        return row[0]
+
+    def put(self, url: str, body: bytes, ttl: Optional[float] = None) -> None:
+        """応答を保存し、上限を超えた分を古い順に削除"""
+        if ttl is None:
+            ttl = get_cache_ttl(url, body)
+        now = time.time()
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO responses (url, body, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                            (normalize_url(url), body, len(body), now + ttl, now))
+            self.evict()
+            self.db.commit()
+
+    def get_feed_days(self, days: List[str], count: bool = True) -> Dict[str, bytes]:
+        """有効期間内の日ごとの番組表（YYYYMMDD → <item> の並び）を取得"""
+        now = time.time()
+        with self.lock:
+            rows = self.db.execute(f"SELECT day, body FROM feed_days WHERE day IN ({','.join('?' * len(days))}) AND expires > ?",
+                                   (*days, now)).fetchall()
+            if count:
+                self.hits += len(rows)
+                self.misses += len(days) - len(rows)
+            if rows:
+                self.db.executemany("UPDATE feed_days SET accessed = ? WHERE day = ?", ((now, x[0]) for x in rows))
+                self.db.commit()
+        return dict(rows)
+
+    def put_feed_days(self, slices: Dict[str, bytes], min_ttl: Optional[float] = None) -> None:
+        """日ごとの番組表を保存し、上限を超えた分を古い順に削除"""
+        now = time.time()
+        with self.lock:
+            for day, body in slices.items():
+                ttl = get_feed_ttl(datetime.datetime.strptime(day, "%Y%m%d") + datetime.timedelta(days=1))
+                if min_ttl is not None:
+                    ttl = max(ttl, min_ttl)
+                self.db.execute("INSERT OR REPLACE INTO feed_days (day, body, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                                (day, body, len(body), now + ttl, now))
+            self.evict()
+            self.db.commit()
+
+    def evict(self) -> None:
+        """期限切れと上限超過のエントリを削除（応答と日ごとの番組表を合わせて古い順）"""
+        now = time.time()
+        self.db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        self.db.execute("DELETE FROM feed_days WHERE expires <= ?", (now,))
+        count, size = self.db.execute("SELECT (SELECT COUNT(*) FROM responses) + (SELECT COUNT(*) FROM feed_days), "
+                                      "(SELECT COALESCE(SUM(size), 0) FROM responses) + (SELECT COALESCE(SUM(size), 0) FROM feed_days)").fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        rows = self.db.execute("SELECT 'responses', 'url', url, size, accessed FROM responses "
+                               "UNION ALL SELECT 'feed_days', 'day', day, size, accessed FROM feed_days ORDER BY accessed").fetchall()
+        for table, column, key, entry_size, _ in rows:
+            if count <= self.max_entries and size <= self.max_bytes:
+                break
+            self.db.execute(f"DELETE FROM {table} WHERE {column} = ?", (key,))
+            count -= 1
+            size -= entry_size
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_failed = False
+_response_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """応答キャッシュを取得（作成できない場合は None）"""
+    global _response_cache, _response_cache_failed
+    with _response_cache_lock:
+        if _response_cache is None and not _response_cache_failed:
+            try:
+                _response_cache = ResponseCache(os.path.join(os.path.dirname(sys.argv[0]), DB_FILE))
+            except sqlite3.Error as e:
+                print(f"{DB_FILE} を開けないためキャッシュを使用しません: {e}", file=sys.stderr)
+                _response_cache_failed = True
+    return _response_cache
+
+class RateLimiter:
+    """トークンバケットによるリクエスト間隔の制御"""
+
+    def __init__(self, rate: float = RATE_LIMIT, burst: int = RATE_BURST) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """トークンを1つ取得（足りない場合は補充まで待機）"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(url: str) -> RateLimiter:
+    """ホストごとのリクエスト制御を取得"""
+    host = urllib.parse.urlsplit(url).netloc.lower()
+    with _rate_limiters_lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = RateLimiter()
+        return _rate_limiters[host]
+
+@dataclass
+class RequestStats:
+    """HTTPリクエストの累計（常駐・監視モードで増え続けないよう1件ごとには記録しない）"""
+    requests: int = 0
+    wire_bytes: int = 0            # 受信したバイト数（圧縮状態）
+    body_bytes: int = 0            # 展開後のバイト数
+    latency: float = 0.0           # 応答受信完了までの秒数の合計
+
+    def __sub__(self, other: "RequestStats") -> "RequestStats":
+        return RequestStats(self.requests - other.requests, self.wire_bytes - other.wire_bytes,
+                            self.body_bytes - other.body_bytes, self.latency - other.latency)
+
+class HttpClient:
+    """接続を再利用し、gzip/deflate 圧縮とタイムアウトに対応したHTTPクライアント"""
+
+    def __init__(self) -> None:
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.stats = RequestStats()
+
+    def get(self, url: str) -> bytes:
+        """URLの内容を取得（リダイレクトに追従）"""
+        import urllib.error
+        for _ in range(HTTP_MAX_REDIRECTS + 1):
+            status, reason, headers, body = self.request(url)
+            location = headers.get("Location")
+            if status in (301, 302, 303, 307, 308) and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            if status >= 400:
+                raise urllib.error.HTTPError(url, status, reason, headers, None)
+            return body
+        raise urllib.error.URLError(f"リダイレクトが多すぎます: {url}")
+
+    def request(self, url: str):
+        """GETリクエストを1回送信"""
+        import http.client
+        import urllib.request
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        proxy = urllib.request.getproxies().get(parts.scheme)
+        if proxy and parts.scheme == "http" and not urllib.request.proxy_bypass(parts.hostname or ""):
+            target = url
+        headers = {
+            "Host": parts.netloc,
+            "User-Agent": "SCRename",
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        }
+
+        start = time.monotonic()
+        for attempt in range(2):
+            conn, reused = self.acquire(key)
+            try:
+                conn.request("GET", target, headers=headers)
+                response = conn.getresponse()
+                data = self.read(response, start)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                # 再利用した接続がサーバー側で切れていた場合は新しい接続でやり直す
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            break
+
+        if response.will_close:
+            conn.close()
+        else:
+            self.release(key, conn)
+
+        body = self.decode(data, response.getheader("Content-Encoding", ""))
+        with self.lock:
+            self.stats = RequestStats(self.stats.requests + 1, self.stats.wire_bytes + len(data),
+                                      self.stats.body_bytes + len(body), self.stats.latency + time.monotonic() - start)
+        trace_count("requests")
+        trace_count("bytes", len(data))
+        return response.status, response.reason, response.headers, body
+
+    def acquire(self, key: Tuple[str, str]) -> Tuple["http.client.HTTPConnection", bool]:
+        """待機中の接続を取得（なければ新規接続）"""
+        import http.client
+        import urllib.request
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, netloc = key
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        proxy = urllib.request.getproxies().get(scheme)
+        if proxy and not urllib.request.proxy_bypass(urllib.parse.urlsplit(f"//{netloc}").hostname or ""):
+            conn = connection_class(urllib.parse.urlsplit(proxy).netloc, timeout=HTTP_CONNECT_TIMEOUT)
+            if scheme == "https":
+                conn.set_tunnel(netloc)
+        else:
+            conn = connection_class(netloc, timeout=HTTP_CONNECT_TIMEOUT)
+        conn.connect()
+        conn.sock.settimeout(HTTP_READ_TIMEOUT)
+        return conn, False
+
+    def release(self, key: Tuple[str, str], conn: "http.client.HTTPConnection") -> None:
+        """接続を待機中に戻す"""
+        with self.lock:
+            self.idle.setdefault(key, []).append(conn)
+
+    def read(self, response: "http.client.HTTPResponse", start: float) -> bytes:
+        """応答本文を受信（全体の受信時間も制限）"""
+        import socket
+        chunks = []
+        while True:
+            chunk = response.read(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if time.monotonic() - start > HTTP_TOTAL_TIMEOUT:
+                raise socket.timeout(f"{HTTP_TOTAL_TIMEOUT}秒以内に受信が完了しませんでした")
+        return b"".join(chunks)
+
+    @staticmethod
+    def decode(data: bytes, encoding: str) -> bytes:
+        """Content-Encoding に応じて展開"""
+        encoding = encoding.strip().lower()
+        if encoding in ("gzip", "x-gzip"):
+            import gzip
+            return gzip.decompress(data)
+        if encoding == "deflate":
+            import zlib
+            try:
+                return zlib.decompress(data)
+            except zlib.error:
+                return zlib.decompress(data, -zlib.MAX_WBITS)
+        return data
+
+    def close(self) -> None:
+        """待機中の接続をすべて閉じる"""
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle.clear()
+
+_http_client: Optional[HttpClient] = None
+_http_client_lock = threading.Lock()
+
+def get_http_client() -> HttpClient:
+    """実行中に共有するHTTPクライアントを取得"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = HttpClient()
+    return _http_client
+
+class OfflineError(Exception):
+    """オフラインのため、キャッシュにない情報を取得できない"""
+
+class RetryPolicy:
+    """指数バックオフ（ジッター付き）による再試行の方針"""
+
+    def __init__(self, attempts: int = RETRY_ATTEMPTS, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY) -> None:
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def is_retryable(e: Exception) -> bool:
+        """再試行で回復する見込みのあるエラーか判定（4xx は 429 以外は再試行しない）"""
+        import http.client
+        import urllib.error
+
+        if isinstance(e, urllib.error.HTTPError):
+            return e.code == 429 or e.code >= 500
+        return isinstance(e, (OSError, http.client.HTTPException))
+
+    def delay(self, attempt: int, e: Optional[Exception] = None) -> float:
+        """attempt 回目の失敗後の待ち時間（同時に失敗したプロセスがずれるよう半分はランダム）"""
+        import random
+
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        # Retry-After が指定されていれば従う
+        retry_after = getattr(e, "headers", None) and e.headers.get("Retry-After", "")
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(self.max_delay, int(retry_after)))
+        return delay
+
+class CircuitBreaker:
+    """エラーが続いたホストへの接続を一定時間止める（状態は SCRename.db でプロセス間共有）"""
+
+    def __init__(self, path: str, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.db = open_database(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS breaker (host TEXT PRIMARY KEY, failures INTEGER NOT NULL, open_until REAL NOT NULL)")
+        self.db.commit()
+
+    def is_open(self, host: str) -> bool:
+        """接続を止めている最中か判定"""
+        with self.lock:
+            row = self.db.execute("SELECT open_until FROM breaker WHERE host = ?", (host,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def record_success(self, host: str) -> None:
+        """成功したので連続エラー回数を消去"""
+        with self.lock:
+            # 削除する行がなくても暗黙のトランザクションが始まるので必ず commit する
+            self.db.execute("DELETE FROM breaker WHERE host = ?", (host,))
+            self.db.commit()
+
+    def record_failure(self, host: str) -> bool:
+        """エラーを記録し、接続を止めた場合は True を返す"""
+        now = time.time()
+        with self.lock:
+            self.db.execute("INSERT OR IGNORE INTO breaker (host, failures, open_until) VALUES (?, 0, 0)", (host,))
+            self.db.execute("UPDATE breaker SET failures = failures + 1 WHERE host = ?", (host,))
+            failures = self.db.execute("SELECT failures FROM breaker WHERE host = ?", (host,)).fetchone()[0]
+            opened = failures >= self.threshold
+            if opened:
+                self.db.execute("UPDATE breaker SET failures = 0, open_until = ? WHERE host = ?", (now + self.cooldown, host))
+            self.db.commit()
+        return opened
+
+_circuit_breaker: Optional[CircuitBreaker] = None
+_circuit_breaker_failed = False
+_circuit_breaker_lock = threading.Lock()
+
+def get_circuit_breaker() -> Optional[CircuitBreaker]:
+    """接続の遮断状態を取得（作成できない場合は None）"""
+    global _circuit_breaker, _circuit_breaker_failed
+    with _circuit_breaker_lock:
+        if _circuit_breaker is None and not _circuit_breaker_failed:
+            try:
+                _circuit_breaker = CircuitBreaker(os.path.join(os.path.dirname(sys.argv[0]), DB_FILE))
+            except sqlite3.Error as e:
+                print(f"{DB_FILE} を開けないため接続の遮断状態を保存しません: {e}", file=sys.stderr)
+                _circuit_breaker_failed = True
+    return _circuit_breaker
+
+_offline_forced = False          # -o オプション
+_offline_local = threading.local()
+
+def set_offline() -> None:
+    """オフラインにする（-o オプション）"""
+    global _offline_forced
+    _offline_forced = True
+
+def get_host(url: str) -> str:
+    """URLのホスト名を取得"""
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+def is_offline(host: str = "cal.syoboi.jp") -> bool:
+    """オフラインか判定（-o 指定時、またはエラーが続いて接続を止めている間）"""
+    if _offline_forced:
+        return True
+    breaker = get_circuit_breaker()
+    try:
+        return breaker is not None and breaker.is_open(host)
+    except sqlite3.Error:
+        return False
+
+def note_offline_miss() -> None:
+    """このスレッドの処理でオフラインのため取得できない情報があったことを記録"""
+    _offline_local.missed = True
+
+def reset_offline_miss() -> None:
+    """オフラインで取得できなかった記録を消去"""
+    _offline_local.missed = False
+
+def offline_missed() -> bool:
+    """このスレッドの処理でオフラインのため取得できない情報があったか"""
+    return getattr(_offline_local, "missed", False)
+
+def lock_file(f) -> None:
+    """ファイルを排他ロック（他のプロセス・スレッドが解放するまで待つ）"""
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK は10秒ほどで諦めるので待ち直す
+                continue
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+def unlock_file(f) -> None:
+    """ファイルのロックを解放"""
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def url_lock(url: str):
+    """URLごとのファイルロック（ロックできない環境では何もしない）"""
+    with named_lock(normalize_url(url)):
+        yield
+
+@contextmanager
+def named_lock(key: str):
+    """キーごとのプロセス間ファイルロック（ロックできない環境では何もしない）"""
+    import hashlib
+
+    lock_dir = os.path.join(os.path.dirname(sys.argv[0]), LOCK_DIR)
+    bucket = int(hashlib.sha1(key.encode("utf-8")).hexdigest(), 16) % LOCK_BUCKETS
+    try:
+        os.makedirs(lock_dir, exist_ok=True)
+        f = open(os.path.join(lock_dir, f"{bucket:02d}.lock"), "a+b")
+    except OSError:
+        yield
+        return
+    try:
+        try:
+            lock_file(f)
+        except OSError:
+            yield
+            return
+        try:
+            yield
+        finally:
+            unlock_file(f)
+    finally:
+        f.close()
+
+def fetch_url(url: str, policy: Optional[RetryPolicy] = None) -> bytes:
+    """URLの内容を通信で取得（エラーは方針に従って再試行し、続く場合は接続を止める）"""
+    policy = policy or RetryPolicy()
+    host = get_host(url)
+    breaker = get_circuit_breaker()
+    attempt = 0
+    while True:
+        get_rate_limiter(url).acquire()
+        try:
+            body = get_http_client().get(url)
+        except Exception as e:
+            if not policy.is_retryable(e):
+                raise
+            if attempt + 1 >= policy.attempts:
+                # 再試行しても取得できなかった場合を1回のエラーとして数え、オフラインと同じく再処理の対象にする
+                try:
+                    opened = breaker is not None and breaker.record_failure(host)
+                except sqlite3.Error:
+                    opened = False
+                if opened:
+                    print(f"{host} でエラーが続いたため、{BREAKER_COOLDOWN} 秒間はキャッシュのみで処理します。", file=sys.stderr)
+                note_offline_miss()
+                raise OfflineError(f"{e}") from e
+            delay = policy.delay(attempt, e)
+            print(f"通信エラー: {e}（{delay:.1f} 秒後に再試行します）", file=sys.stderr)
+            time.sleep(delay)
+            trace_count("retries")
+            attempt += 1
+            continue
+        if breaker is not None:
+            try:
+                breaker.record_success(host)
+            except sqlite3.Error:
+                pass
+        return body
+
+def open_url(url: str, min_ttl: Optional[float] = None, refresh: bool = False) -> str:
+    """URLの内容を文字列で取得（キャッシュがあればキャッシュから取得）"""
+    return open_url_bytes(url, min_ttl, refresh).decode("utf-8")
+
+def open_url_bytes(url: str, min_ttl: Optional[float] = None, refresh: bool = False) -> bytes:
+    """URLの内容を取得（キャッシュがあればキャッシュから取得）
+
+    min_ttl を指定すると少なくともその秒数はキャッシュを保持し、refresh を指定するとキャッシュを使わずに取得する。
+    """
+    cache = get_response_cache()
+    if cache and not refresh:
+        body = cache.get(url)
+        if body is not None:
+            trace_count("cache_hits")
+            return body
+        trace_count("cache_misses")
+    if is_offline(get_host(url)):
+        note_offline_miss()
+        raise OfflineError(f"オフラインのため取得できません: {url}")
+    if not cache:
+        return fetch_url(url)
+
+    # 同じURLを同時に取得しようとしている他のプロセスがあれば、その取得を待ってキャッシュから読む
+    with url_lock(url):
+        if not refresh:
+            body = cache.get(url, count_miss=False)
+            if body is not None:
+                trace_count("cache_hits")
+                return body
+        body = fetch_url(url)
+        ttl = get_cache_ttl(url, body)
+        if min_ttl is not None:
+            ttl = max(ttl, min_ttl)
+        try:
+            cache.put(url, body, ttl)
+        except sqlite3.Error as e:
+            print(f"キャッシュを保存できませんでした: {e}", file=sys.stderr)
+    return body
+
+def normalize_title(title: str) -> str:
+    """TID検索用にタイトルを正規化（空白除去・大文字化）"""
+    return title.replace(" ", "").upper()
+
+def title_bigrams(title2: str) -> List[str]:
+    """正規化したタイトルの2文字ずつの組を取得（1文字の場合はその文字）"""
+    if len(title2) < 2:
+        return [title2] if title2 else []
+    return sorted({title2[i:i+2] for i in range(len(title2) - 1)})
+
+def parse_tid_line(line: str) -> Optional[Tuple[str, int]]:
+    """SCRename.tid の1行を（タイトル, TID）に分解"""
+    parts = line.strip().split(",", 1)
+    if len(parts) == 2 and parts[1].strip().isdigit():
+        return parts[0], int(parts[1])
+    return None
+
+class TidStore:
+    """番組名の正規化文字列で索引化した TID ストア（SCRename.tid の内容を1行ずつ保持）"""
+
+    def __init__(self, path: str, tid_path: str) -> None:
+        self.lock = threading.Lock()
+        self.tid_path = tid_path
+        self.tid_file_mtime = None
+        self.db = open_database(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # 1つのTIDに複数のタイトル（別名）を持てるよう、正規化したタイトルとTIDの組をキーにする
+        # （TIDごとに1タイトルの旧形式の表は作り直し、SCRename.tid にない行は書き戻す）
+        old_rows = []
+        columns = [x[1] for x in self.db.execute("PRAGMA table_info(tids)")]
+        if columns and "line" not in columns:
+            old_rows = self.db.execute("SELECT tid, title FROM tids").fetchall()
+            with self.db:
+                self.db.execute("DROP TABLE tids")
+                self.db.execute("DELETE FROM meta WHERE key = 'tid_file_mtime'")
+        self.db.execute("CREATE TABLE IF NOT EXISTS tids (norm TEXT NOT NULL, tid INTEGER NOT NULL, title TEXT NOT NULL, "
+                        "line INTEGER NOT NULL, PRIMARY KEY (norm, tid)) WITHOUT ROWID")
+        # db.php（TitleLookup）から同期したタイトル一覧と、正規化したタイトルの2文字ずつの索引
+        self.db.execute("CREATE TABLE IF NOT EXISTS titles (tid INTEGER PRIMARY KEY, title TEXT NOT NULL, norm TEXT NOT NULL, updated TEXT NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS titles_norm ON titles (norm)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS title_grams (gram TEXT NOT NULL, tid INTEGER NOT NULL, PRIMARY KEY (gram, tid)) WITHOUT ROWID")
+        self.db.commit()
+        if old_rows:
+            self.add(old_rows)
+
+    def import_tid_file(self) -> int:
+        """SCRename.tid を取り込み直す（前回取り込み後に更新・削除された場合のみ。削除された行はストアからも消す）"""
+        try:
+            st = os.stat(self.tid_path)
+            mtime = f"{st.st_mtime_ns}:{st.st_size}"
+        except FileNotFoundError:
+            mtime = ""
+        except OSError:
+            return 0
+        if mtime == self.tid_file_mtime:
+            return 0
+        with self.lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'tid_file_mtime'").fetchone()
+            if row and row[0] == mtime:
+                self.tid_file_mtime = mtime
+                return 0
+            rows = []
+            if mtime:
+                with open(self.tid_path, "r", encoding="utf-8") as f:
+                    for i, line in enumerate(f):
+                        entry = parse_tid_line(line)
+                        if entry:
+                            rows.append((normalize_title(entry[0]), entry[1], entry[0], i))
+            with self.db:
+                self.db.execute("DELETE FROM tids")
+                self.db.executemany("INSERT OR IGNORE INTO tids (norm, tid, title, line) VALUES (?, ?, ?, ?)", rows)
+                self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('tid_file_mtime', ?)", (mtime,))
+            self.tid_file_mtime = mtime
+        return len(rows)
+
+    def find(self, title2: str) -> Optional[Tuple[int, str, bool]]:
+        """正規化したタイトルが title2 で始まるTIDを取得し、（TID, タイトル, 同期したタイトル一覧から見つけたか）を返す
+
+        TID 定義では TID が最小のもの、同期したタイトル一覧では同名のリメイクなどがあるため TID が最大（最新）のものを優先する。
+        """
+        with self.lock:
+            for table, order in (("tids", "tid, line"), ("titles", "tid DESC")):
+                row = self.db.execute(f"SELECT tid, title FROM {table} WHERE norm >= ? AND norm < ? ORDER BY {order} LIMIT 1",
+                                      (title2, title2 + "\U0010ffff")).fetchone()
+                if row:
+                    return row[0], row[1], table == "titles"
+        return None
+
+    def similar(self, title2: str, limit: int = SIMILAR_TITLES) -> List[Tuple[int, str]]:
+        """同期したタイトル一覧から2文字ずつの組が多く一致するタイトルを取得"""
+        grams = title_bigrams(title2)
+        if not grams:
+            return []
+        with self.lock:
+            rows = self.db.execute(f"SELECT t.tid, t.title, t.norm, COUNT(*) FROM title_grams g JOIN titles t ON t.tid = g.tid "
+                                   f"WHERE g.gram IN ({','.join('?' * len(grams))}) GROUP BY t.tid", grams).fetchall()
+
+        # 一致した組の割合（Dice係数）の高い順
+        def score(row) -> float:
+            return 2 * row[3] / (len(grams) + len(title_bigrams(row[2])))
+        rows.sort(key=lambda x: (-score(x), x[0]))
+        return [(x[0], x[1]) for x in rows[:limit] if score(x) >= 0.5]
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """meta テーブルの値を取得"""
+        with self.lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def sync_titles(self, items: List[Tuple[int, str, str]]) -> int:
+        """タイトル一覧（TID, タイトル, 更新日時）を保存して索引を更新し、保存済みの件数を返す"""
+        with self.lock, self.db:
+            for tid, title, updated in items:
+                norm = normalize_title(title)
+                self.db.execute("DELETE FROM title_grams WHERE tid = ?", (tid,))
+                self.db.execute("INSERT OR REPLACE INTO titles (tid, title, norm, updated) VALUES (?, ?, ?, ?)", (tid, title, norm, updated))
+                self.db.executemany("INSERT OR IGNORE INTO title_grams (gram, tid) VALUES (?, ?)", ((x, tid) for x in title_bigrams(norm)))
+            if items:
+                last = max(x[2] for x in items)
+                row = self.db.execute("SELECT value FROM meta WHERE key = 'title_last_update'").fetchone()
+                if row is None or row[0] < last:
+                    self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('title_last_update', ?)", (last,))
+            return self.db.execute("SELECT COUNT(*) FROM titles").fetchone()[0]
+
+    def add(self, items: List[Tuple[int, str]]) -> None:
+        """TIDとタイトルの組を SCRename.tid にTID順で書き戻して取り込み直す（同じTIDの別名は残す）"""
+        # 同時に終わった録画が同じファイルを書き換えても行を失わないよう、プロセス間でロックする
+        with named_lock(self.tid_path):
+            try:
+                with open(self.tid_path, "r", encoding="utf-8") as f:
+                    lines = f.read().splitlines()
+            except FileNotFoundError:
+                lines = []
+            parsed = [parse_tid_line(x) for x in lines]
+            existing = {(normalize_title(x[0]), x[1]) for x in parsed if x}
+            added = False
+            for tid, title in items:
+                if (normalize_title(title), tid) in existing:
+                    continue
+                existing.add((normalize_title(title), tid))
+                insert_pos = next((i for i, x in enumerate(parsed) if x and x[1] > tid), len(lines))
+                lines.insert(insert_pos, f"{title},{tid}")
+                parsed.insert(insert_pos, (title, tid))
+                added = True
+            if not added:
+                return
+            with open(self.tid_path + ".tmp", "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(self.tid_path + ".tmp", self.tid_path)
+        self.import_tid_file()
+
+_tid_store: Optional[TidStore] = None
+_tid_store_lock = threading.Lock()
+
+def get_tid_store() -> Optional[TidStore]:
+    """TIDストアを取得（初回は SCRename.tid を取り込む）"""
+    global _tid_store
+    with _tid_store_lock:
+        script_path = os.path.dirname(sys.argv[0])
+        try:
+            if _tid_store is None:
+                _tid_store = TidStore(os.path.join(script_path, DB_FILE), os.path.join(script_path, "SCRename.tid"))
+            _tid_store.import_tid_file()
+        except sqlite3.Error as e:
+            print(f"{DB_FILE} を開けませんでした: {e}", file=sys.stderr)
+            return None
+    return _tid_store
+
+def get_tid_from_cache(title: str, title2: str) -> Tuple[Optional[int], Optional[str], bool]:
+    """TIDストアからTIDを取得（3番目は同期したタイトル一覧から見つけた場合に True）"""
+    store = get_tid_store()
+    found = store.find(title2) if store else None
+    if found is None:
+        return None, title, False
+    print(f"{DB_FILE} から", end="", file=sys.stderr)
+    return found
+
+def print_similar_titles(title2: str) -> None:
+    """同期したタイトル一覧から似たタイトルを表示"""
+    store = get_tid_store()
+    try:
+        similar = store.similar(title2) if store else []
+    except sqlite3.Error:
+        return
+    if similar:
+        print("似たタイトル: " + "、".join(f"{title}（{tid}）" for tid, title in similar), file=sys.stderr)
 
 def search_tid_from_web(title: str, title2: str) -> Tuple[Optional[int], Optional[str]]:
     """しょぼいカレンダーからTIDを検索"""
     encoded_title = urllib.parse.quote(title.encode("utf-8"))
     search_url = f"http://cal.syoboi.jp/find?kw={encoded_title}"
     
-    for i in range(3):
-        if i > 0:
-            time.sleep(1)
-        
-        try:
-            with urllib.request.urlopen(search_url) as response:
-                html = response.read().decode("utf-8")
-                break
-        except Exception as e:
-            if i == 2:
-                print("\nしょぼいカレンダーにアクセスできませんでした。", file=sys.stderr)
-                return None, title
-            continue
+    try:
+        html = open_url(search_url)
+    except Exception as e:
+        print("\nしょぼいカレンダーにアクセスできませんでした。", file=sys.stderr)
+        return None, title
     
     # HTMLエンティティの処理
     html = html.replace("\\", "＼")
@@ -481,31 +1396,92 @@ def search_tid_from_web(title: str, title2: str) -> Tuple[Optional[int], Optiona
     return None, title
 
 def update_tid_cache(tid: int, title: str) -> None:
-    """SCRename.tidファイルを更新"""
-    tid_path = os.path.join(os.path.dirname(sys.argv[0]), "SCRename.tid")
-    
-    if os.path.exists(tid_path):
-        with open(tid_path, "r", encoding="utf-8") as f:
-            tid_data = [line.strip().split(",", 1) for line in f]
-    else:
-        tid_data = []
-    
-    # 新しいTIDを挿入
-    insert_pos = 0
-    for i, (_, tid_id) in enumerate(tid_data):
-        if int(tid_id) == tid:
-            tid_data[i] = [title, str(tid)]
-            break
-        elif int(tid_id) > tid:
-            insert_pos = i
+    """SCRename.tid とTIDストアを更新"""
+    store = get_tid_store()
+    if store:
+        try:
+            store.add([(tid, title)])
+        except (OSError, sqlite3.Error) as e:
+            print(f"TIDを保存できませんでした: {e}", file=sys.stderr)
+
+def build_prog_lookup_url(tid: int, ch_id: str, count: Optional[int] = None) -> str:
+    """db.php の ProgLookup の検索URLを生成（count を省略するとその TID の全話）"""
+    service_param = f"&ChID={ch_id}" if ch_id else ""
+    count_param = f"&Count={count}" if count is not None else ""
+    return f"http://cal.syoboi.jp/db.php?Command=ProgLookup&TID={tid}{service_param}{count_param}&Fields=StTime,EdTime,ChID,STSubTitle,Count&JOIN=SubTitles"
+
+@dataclass
+class EpisodeInfo:
+    """db.php（ProgLookup）の1話分の放送情報"""
+    start: Optional[datetime.datetime]
+    end: Optional[datetime.datetime]
+    ch_id: str
+    subtitle: str
+
+def get_xml_text(content: str, tag: str) -> str:
+    """最初の <tag> の内容を取得（ない場合は空文字列）"""
+    i = content.find(f"<{tag}>")
+    if i < 0:
+        return ""
+    i += len(tag) + 2
+    j = content.find(f"</{tag}>", i)
+    return content[i:j] if j >= 0 else ""
+
+def parse_prog_time(text: str) -> Optional[datetime.datetime]:
+    """db.php の日時（YYYY-MM-DD HH:MM:SS）を変換"""
+    try:
+        return datetime.datetime.strptime(text, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+
+def parse_episode_list(content: str) -> Dict[int, EpisodeInfo]:
+    """db.php（ProgLookup）の応答を解析し、話数 → 放送情報を取得（同じ話数は最初の放送）"""
+    episodes: Dict[int, EpisodeInfo] = {}
+    i = content.find("<ProgItem")
+    while i >= 0:
+        j = content.find("</ProgItem>", i)
+        if j < 0:
             break
-    else:
-        tid_data.insert(insert_pos, [title, str(tid)])
-    
-    # ファイルに書き込み
-    with open(tid_path, "w", encoding="utf-8") as f:
-        for tid_title, tid_id in tid_data:
-            f.write(f"{tid_title},{tid_id}\n")
+        item = content[i:j]
+        count = get_xml_text(item, "Count")
+        if count.isdigit() and int(count) not in episodes:
+            subtitle = get_xml_text(item, "STSubTitle")
+            # HTMLエンティティを変換
+            for k in range(len(CHAR9)):
+                subtitle = subtitle.replace(f"&{CHAR9[k]};", CHAR10[k])
+            episodes[int(count)] = EpisodeInfo(parse_prog_time(get_xml_text(item, "StTime")), parse_prog_time(get_xml_text(item, "EdTime")),
+                                               get_xml_text(item, "ChID"), subtitle)
+        i = content.find("<ProgItem", j + 11)
+    return episodes
+
+_episode_lists: Dict[Tuple[int, str], Tuple[float, Dict[int, EpisodeInfo]]] = {}
+_episode_lists_lock = threading.Lock()
+
+def get_episode_list(tid: int, ch_id: str) -> Optional[Dict[int, EpisodeInfo]]:
+    """TID（と放送局）の全話の放送情報を取得（同じ TID のファイルでは1回だけ取得・解析する）"""
+    key = (tid, ch_id)
+    with _episode_lists_lock:
+        cached = _episode_lists.pop(key, None)
+        if cached and cached[0] > time.monotonic():
+            # 最近使ったものを後ろに並べ直す
+            _episode_lists[key] = cached
+            return cached[1]
+    url = build_prog_lookup_url(tid, ch_id)
+    try:
+        content = open_url(url)
+    except Exception as e:
+        print("しょぼいカレンダーにアクセスできませんでした。", file=sys.stderr)
+        return None
+    episodes = parse_episode_list(content)
+    now = time.monotonic()
+    with _episode_lists_lock:
+        # 常駐モードで増え続けないよう、期限切れと上限を超えた古いものを削除
+        for old_key in [k for k, v in _episode_lists.items() if v[0] <= now]:
+            del _episode_lists[old_key]
+        _episode_lists[key] = (now + get_cache_ttl(url, content.encode("utf-8")), episodes)
+        while len(_episode_lists) > EPISODE_LISTS_MAX:
+            del _episode_lists[next(iter(_episode_lists))]
+    return episodes
 
 def get_program_info_by_tid(tid: int, number: str, serv: int, service: List[List[str]]) -> Optional[str]:
     """TIDを使用して番組情報を取得"""
@@ -515,70 +1491,149 @@ def get_program_info_by_tid(tid: int, number: str, serv: int, service: List[List
     
     print(f"第{number}話{service_param}の情報を検索します。\n", file=sys.stderr)
     
-    search_url = f"http://cal.syoboi.jp/db.php?Command=ProgLookup&TID={tid}{service_param}&Count={number}&Fields=StTime,EdTime,ChID,STSubTitle&JOIN=SubTitles"
-    
-    for i in range(3):
-        if i > 0:
-            time.sleep(1)
-        
-        try:
-            with urllib.request.urlopen(search_url) as response:
-                html = response.read().decode("utf-8")
-                break
-        except Exception as e:
-            if i == 2:
-                print("しょぼいカレンダーにアクセスできませんでした。", file=sys.stderr)
-                return None
-            continue
-    
-    # 番組情報の解析
-    i = html.find("<StTime>")
-    if i > 0:
-        i += 8
-        j = html.find("</StTime>", i)
-        date_str = html[i:j].replace("-", "/")
-        try:
-            stdt = datetime.datetime.strptime(date_str, "%Y/%m/%d %H:%M:%S")
-        except ValueError:
-            pass
-        
-        i = html.find("<EdTime>", j + 9) + 8
-        j = html.find("</EdTime>", i)
-        date_str = html[i:j].replace("-", "/")
+    episodes = get_episode_list(tid, service[serv][3] if serv >= 0 else "")
+    episode = episodes.get(int(number)) if episodes is not None and str(number).isdigit() else None
+    if episode is None:
+        return None
+    return episode.subtitle
+
+def get_search_window(tgtdt: datetime.datetime, days: int) -> Tuple[datetime.datetime, int]:
+    """rss2.php の検索開始日と日数を取得"""
+    stdt = tgtdt - datetime.timedelta(days=days)
+    return datetime.datetime(stdt.year, stdt.month, stdt.day), days + 1
+
+def build_rss_url(start: datetime.datetime, days: int) -> str:
+    """rss2.php の検索URLを生成"""
+    start_date = f"{start.year}{start.month:02d}{start.day:02d}0000"
+    return f"http://cal.syoboi.jp/rss2.php?start={start_date}&days={days}&usr=SCRename&titlefmt=%24(Title)%7C%24(ChName)%7C%24(EdTime)%7C%24(SubTitleB)"
+
+def split_feed_days(data: bytes, start: datetime.datetime, days: int) -> Dict[str, bytes]:
+    """rss2.php の応答を開始日ごとの <item> の並びに分割（番組のない日も空で含める）"""
+    items: Dict[str, List[bytes]] = {f"{start + datetime.timedelta(days=i):%Y%m%d}": [] for i in range(days)}
+    i = data.find(b"<item>")
+    while i >= 0:
+        j = data.find(b"</item>", i)
+        if j < 0:
+            break
+        j += 7
+        n = data.find(b"<pubDate>", i, j)
+        if n >= 0:
+            day = data[n+9:n+19].replace(b"-", b"").decode("ascii", "replace")
+            if day in items:
+                items[day].append(data[i:j])
+        i = data.find(b"<item>", j)
+    return {day: b"\n".join(x) for day, x in items.items()}
+
+def fetch_feed_days(start: datetime.datetime, days: int, min_ttl: Optional[float] = None, refresh: bool = False) -> Dict[str, bytes]:
+    """連続した日の番組表を rss2.php から取得して日ごとにキャッシュ"""
+    url = build_rss_url(start, days)
+    if is_offline(get_host(url)):
+        note_offline_miss()
+        raise OfflineError(f"オフラインのため取得できません: {url}")
+    cache = get_response_cache()
+    if not cache:
+        return split_feed_days(fetch_url(url), start, days)
+
+    # 同じ日を同時に取得しようとしている他のプロセスがあれば、その取得を待ってキャッシュから読む
+    with url_lock(url):
+        if not refresh:
+            slices = cache.get_feed_days([f"{start + datetime.timedelta(days=i):%Y%m%d}" for i in range(days)], count=False)
+            if len(slices) == days:
+                return slices
+        slices = split_feed_days(fetch_url(url), start, days)
         try:
-            eddt = datetime.datetime.strptime(date_str, "%Y/%m/%d %H:%M:%S")
-        except ValueError:
-            pass
-        
-        i = html.find("<ChID>", j + 9) + 6
-        j = html.find("</ChID>", i)
-        ch_id = html[i:j]
-        if ch_id.isdigit():
-            for i, serv_info in enumerate(service):
-                if serv_info[3] == ch_id:
-                    serv = i
-                    break
-        
-        i = html.find("<STSubTitle>", j + 7) + 12
-        j = html.find("</STSubTitle>", i)
-        subtitle = html[i:j]
-        
-        # HTMLエンティティの処理
-        for i in range(len(CHAR9)):
-            subtitle = subtitle.replace(f"&{CHAR9[i]};", CHAR10[i])
-        
-        return subtitle
-    
-    return None
+            cache.put_feed_days(slices, min_ttl)
+        except sqlite3.Error as e:
+            print(f"キャッシュを保存できませんでした: {e}", file=sys.stderr)
+    return slices
+
+def fetch_feed(start: datetime.datetime, days: int, min_ttl: Optional[float] = None, refresh: bool = False) -> bytes:
+    """検索期間の番組表をキャッシュ済みの日から組み立て、足りない連続した日だけ rss2.php から取得
+
+    min_ttl を指定すると少なくともその秒数はキャッシュを保持し、refresh を指定するとキャッシュを使わずに取得する。
+    """
+    keys = [f"{start + datetime.timedelta(days=i):%Y%m%d}" for i in range(days)]
+    cache = get_response_cache()
+    slices = cache.get_feed_days(keys) if cache and not refresh else {}
+    missing = [i for i, key in enumerate(keys) if key not in slices]
+    if cache and not refresh:
+        trace_count("cache_hits", days - len(missing))
+        trace_count("cache_misses", len(missing))
+
+    # 足りない日を連続した範囲ごとに取得
+    runs: List[List[int]] = []
+    for i in missing:
+        if runs and runs[-1][1] == i:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    for first, last in runs:
+        slices.update(fetch_feed_days(start + datetime.timedelta(days=first), last - first, min_ttl, refresh))
+    return b"<rss><channel>\n" + b"\n".join(slices[x] for x in keys) + b"\n</channel></rss>"
 
-def search_program(title: str, tgtdt: datetime.datetime, days: int, serv: int, service: List[List[str]], options: RenameOptions, dtflag: int) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[datetime.datetime], Optional[datetime.datetime]]:
-    """番組検索"""
+def fetch_rss(start: datetime.datetime, days: int) -> Optional[bytes]:
+    """rss2.php から番組情報を取得"""
+    try:
+        return fetch_feed(start, days)
+    except Exception as e:
+        print(f"検索エラー: {e}", file=sys.stderr)
+        print("しょぼいカレンダーにアクセスできませんでした。", file=sys.stderr)
+        return None
+
+class FeedPlan:
+    """複数ファイルの検索期間をまとめて rss2.php の取得回数を減らす"""
+
+    def __init__(self) -> None:
+        self.windows: List[Tuple[datetime.datetime, int]] = []
+        self.feeds: List[Tuple[datetime.datetime, datetime.datetime, Optional[ProgramSchedule]]] = []
+
+    def add(self, start: datetime.datetime, days: int) -> None:
+        """検索期間を追加"""
+        self.windows.append((start, days))
+
+    def merge(self) -> List[Tuple[datetime.datetime, int]]:
+        """重なる・隣接する検索期間を RSS_MAX_DAYS 日以内で結合"""
+        runs = []
+        for start, days in sorted(set(self.windows)):
+            end = start + datetime.timedelta(days=days)
+            if runs:
+                run_start, run_end = runs[-1]
+                if start <= run_end and (max(run_end, end) - run_start).days <= RSS_MAX_DAYS:
+                    runs[-1] = (run_start, max(run_end, end))
+                    continue
+            runs.append((start, end))
+        return [(start, (end - start).days) for start, end in runs]
+
+    def fetch(self, max_workers: int = 1) -> None:
+        """結合した検索期間ごとに rss2.php を取得して解析"""
+        trace = get_trace()
+
+        def fetch_schedule(run: Tuple[datetime.datetime, int]) -> Optional[ProgramSchedule]:
+            with use_trace(trace), trace_stage("rss2"):
+                data = fetch_rss(*run)
+                return ProgramSchedule.parse(data) if data is not None else None
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        runs = self.merge()
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            schedules = executor.map(fetch_schedule, runs)
+            for (start, days), schedule in zip(runs, schedules):
+                self.feeds.append((start, start + datetime.timedelta(days=days), schedule))
+
+    def get(self, start: datetime.datetime, days: int) -> Optional[ProgramSchedule]:
+        """検索期間を含む取得済みの番組表を返す"""
+        end = start + datetime.timedelta(days=days)
+        for feed_start, feed_end, schedule in self.feeds:
+            if feed_start <= start and end <= feed_end:
+                return schedule
+        return None
+
+def search_program(title: str, tgtdt: datetime.datetime, days: int, serv: int, service: List[List[str]], options: RenameOptions, dtflag: int, feeds: Optional[FeedPlan] = None) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[datetime.datetime], Optional[datetime.datetime]]:
+    """番組検索（feeds指定時は取得済みのフィードから検索）"""
     if not title:
         return None, None, None, None, None
     
-    # 検索開始日時設定
-    stdt = tgtdt - datetime.timedelta(days=days)
-    
     # しょぼいカレンダーより情報取得
     if not options.recursive_search:  # -a1 オプションでない場合
         # 日付が取得できなかった場合のメッセージ
@@ -601,33 +1656,28 @@ def search_program(title: str, tgtdt: datetime.datetime, days: int, serv: int, s
             service_name = f"（{service[serv][1]}）"
         print(f"「{title}」{service_name}を検索します。\n", file=sys.stderr)
         
-        # 検索開始日時を文字列に変換
-        start_date = f"{stdt.year}{stdt.month:02d}{stdt.day:02d}0000"
-        
-        # 検索URL生成
-        search_url = f"http://cal.syoboi.jp/rss2.php?start={start_date}&days={days+1}&usr=SCRename&titlefmt=%24(Title)%7C%24(ChName)%7C%24(EdTime)%7C%24(SubTitleB)"
-        
-        # 最大3回リトライ
-        html = None
-        for i in range(3):
-            if i > 0:
-                time.sleep(1)  # 1秒待機
-            
-            try:
-                with urllib.request.urlopen(search_url) as response:
-                    html = response.read().decode("utf-8")
-                    break
-            except Exception as e:
-                print(f"検索エラー: {e}", file=sys.stderr)
-                if i == 2:  # 最後の試行でエラー
-                    print("しょぼいカレンダーにアクセスできませんでした。", file=sys.stderr)
-                    return None, None, None, None, None
-                continue
+        # 検索期間の設定
+        start, search_days = get_search_window(tgtdt, days)
+        window = None
+        if feeds is None:
+            with trace_stage("rss2"):
+                data = fetch_rss(start, search_days)
+                schedule = ProgramSchedule.parse(data) if data is not None else None
+            if schedule is None:
+                return None, None, None, None, None
+        else:
+            schedule = feeds.get(start, search_days)
+            if schedule is None:
+                if is_offline():
+                    note_offline_miss()
+                print("しょぼいカレンダーにアクセスできませんでした。", file=sys.stderr)
+                return None, None, None, None, None
+            window = (start, start + datetime.timedelta(days=search_days))
         
-        if html:
-            program_title, subtitle, serv, stdt, eddt, number = search_program_info(html, title, serv, service, tgtdt, dtflag)
-            if program_title:
-                return program_title, subtitle, number, stdt, eddt
+        with trace_stage("search"):
+            program_title, subtitle, serv, stdt, eddt, number = search_schedule(schedule, title, serv, service, tgtdt, dtflag, window)
+        if program_title:
+            return program_title, subtitle, number, stdt, eddt
         
         # 話数検索
         if options.search_episode or options.recursive_search:  # -a または -a1 オプション
@@ -636,12 +1686,100 @@ def search_program(title: str, tgtdt: datetime.datetime, days: int, serv: int, s
             print("話数検索を行います。\n", file=sys.stderr)
             
             # search_episode_info関数を呼び出して話数検索を実行
-            return search_episode_info(title, title, serv, service, options)
+            with trace_stage("episode"):
+                return search_episode_info(title, title, serv, service, options)
     
     return None, None, None, None, None
 
-def rename_file(src_path: str, dst_path: str, options: RenameOptions) -> bool:
-    """ファイルリネーム"""
+def copy_file_data(src, dst, progress: Optional[Callable[[int], None]] = None) -> int:
+    """ファイルの内容をコピーしてバイト数を返す（可能な場合はカーネル内でコピー）"""
+    src_fd = src.fileno()
+    dst_fd = dst.fileno()
+    # copy_file_range は Python 3.8 以降の Linux、ファイル間の sendfile は Linux のみ
+    methods = [x for x in ("copy_file_range", "sendfile") if hasattr(os, x) and sys.platform.startswith("linux")]
+    buffer = None
+    done = 0
+    while True:
+        if methods:
+            try:
+                if methods[0] == "copy_file_range":
+                    n = os.copy_file_range(src_fd, dst_fd, MOVE_CHUNK)
+                else:
+                    n = os.sendfile(dst_fd, src_fd, None, MOVE_CHUNK)
+            except OSError as e:
+                import errno
+
+                # ファイルシステムが対応していない場合は次の方法で続きからコピー
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM):
+                    raise
+                methods.pop(0)
+                continue
+        else:
+            if buffer is None:
+                buffer = memoryview(bytearray(1024 * 1024))
+            n = src.readinto(buffer)
+            written = 0
+            while written < (n or 0):
+                written += dst.write(buffer[written:n])
+        if not n:
+            return done
+        done += n
+        if progress:
+            progress(done)
+
+def move_file(src_path: str, dst_path: str, sync: bool = False, stream=None) -> None:
+    """ファイルを移動（別のドライブの場合はコピーして確認後に元のファイルを削除）"""
+    try:
+        os.rename(src_path, dst_path)
+        return
+    except OSError as e:
+        import errno
+
+        if e.errno != errno.EXDEV:
+            raise
+
+    st = os.stat(src_path)
+    name = os.path.basename(src_path)
+    stream = stream or sys.stderr
+    next_report = [time.monotonic() + MOVE_PROGRESS]
+
+    def report(done: int) -> None:
+        if time.monotonic() >= next_report[0]:
+            next_report[0] = time.monotonic() + MOVE_PROGRESS
+            print(f"{name} をコピー中... {done * 100 // max(st.st_size, 1)}%（{done >> 20} / {st.st_size >> 20} MB）", file=stream)
+
+    # 途中で失敗しても移動先に不完全なファイルが残らないよう別名でコピーしてから名前を変える
+    part_path = dst_path + MOVE_PART_SUFFIX
+    try:
+        with open(src_path, "rb", buffering=0) as src, open(part_path, "wb", buffering=0) as dst:
+            copied = copy_file_data(src, dst, report)
+            if os.utime in os.supports_fd:
+                os.utime(dst.fileno(), ns=(st.st_atime_ns, st.st_mtime_ns))
+            if sync:
+                os.fsync(dst.fileno())
+        if os.utime not in os.supports_fd:
+            os.utime(part_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        size = os.stat(part_path).st_size
+        if copied != st.st_size or size != st.st_size:
+            raise OSError(f"コピーしたファイルのサイズが一致しません（{size} / {st.st_size} バイト）")
+        os.rename(part_path, dst_path)
+        if sync and os.name == "posix":
+            fd = os.open(os.path.dirname(os.path.abspath(dst_path)), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+    except BaseException:
+        try:
+            os.unlink(part_path)
+        except OSError:
+            pass
+        raise
+    os.unlink(src_path)
+
+def rename_file(src_path: str, dst_path: str, options: RenameOptions, stream=None) -> bool:
+    """ファイルリネーム（stream は別ドライブへのコピーの進捗の出力先）"""
+    from pathlib import Path
     try:
         src = Path(src_path)
         dst = Path(dst_path)
@@ -656,29 +1794,81 @@ def rename_file(src_path: str, dst_path: str, options: RenameOptions) -> bool:
                 print(f"{dst} はすでに存在しています。", file=sys.stderr)
                 return False
             
-            src.rename(dst)
+            move_file(str(src), str(dst), options.sync_move, stream)
 
         print(dst)
+        trace_value("dst", str(dst))
         return True
     except Exception as e:
         print(f"リネームエラー: {e}", file=sys.stderr)
         return False
 
+def rules_independent(first: Tuple[str, str], second: Tuple[str, str]) -> bool:
+    """first の後に second を順に置換した結果が、両方を1回の走査でまとめて置換した結果と同じになるか"""
+    (src1, dst1), (src2, dst2) = first, second
+    # first の置換結果（削除した場合は前後がつながった部分）に second が一致しうる
+    if not dst1 or set(dst1) & set(src2):
+        return False
+    # 一致する部分が重なりうる
+    if not src1 or not src2 or src1 in src2 or src2 in src1:
+        return False
+    return not any(src1.endswith(src2[:i]) or src2.endswith(src1[:i]) for i in range(1, min(len(src1), len(src2))))
+
+class ReplaceRules:
+    """置換定義を定義順に適用する（互いに影響しない連続した定義は1つの正規表現にまとめて1回の走査で置換する）"""
+
+    def __init__(self, rules: List[Tuple[str, str]]) -> None:
+        groups: List[List[Tuple[str, str]]] = []
+        for rule in rules:
+            if groups and all(rules_independent(x, rule) for x in groups[-1]):
+                groups[-1].append(rule)
+            else:
+                groups.append([rule])
+        self.passes: List[Callable[[str], str]] = []
+        for group in groups:
+            if len(group) == 1:
+                src, dst = group[0]
+                self.passes.append(lambda text, src=src, dst=dst: text.replace(src, dst))
+            else:
+                table = dict(group)
+                pattern = re.compile("|".join(map(re.escape, table)))
+                self.passes.append(functools.partial(pattern.sub, lambda m, table=table: table[m.group(0)]))
+
+    def apply(self, text: str) -> str:
+        """置換を適用"""
+        for replace in self.passes:
+            text = replace(text)
+        return text
+
+_replace_rules: Dict[str, Tuple[int, ReplaceRules]] = {}
+
+def load_replace_rules(path: str) -> ReplaceRules:
+    """置換定義ファイルを読み込む（更新されていなければ前回の結果を再利用）"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return ReplaceRules([])
+    cached = _replace_rules.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    rules = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith(":"):
+                    parts = line.split(",", 1)
+                    if len(parts) == 2:
+                        rules.append((parts[0], parts[1]))
+    except Exception as e:
+        print(f"{os.path.basename(path)}の読み込みでエラーが発生しました: {e}", file=sys.stderr)
+    compiled = ReplaceRules(rules)
+    _replace_rules[path] = (mtime, compiled)
+    return compiled
+
 def load_replace_file(script_path: str, filename: str) -> str:
-    """SCRename.rp1ファイルを読み込み、ファイル名を置換"""
-    rp1_path = os.path.join(script_path, "SCRename.rp1")
-    if os.path.exists(rp1_path):
-        try:
-            with open(rp1_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith(":"):
-                        parts = line.split(",", 1)
-                        if len(parts) == 2:
-                            filename = filename.replace(parts[0], parts[1])
-        except Exception as e:
-            print(f"SCRename.rp1の読み込みでエラーが発生しました: {e}", file=sys.stderr)
-    return filename
+    """SCRename.rp1の置換ルールを適用する"""
+    return load_replace_rules(os.path.join(script_path, "SCRename.rp1")).apply(filename)
 
 def process_episode_number(subtitle: str) -> Tuple[str, str, str, str]:
     """話数処理を行う"""
@@ -802,19 +1992,111 @@ def replace_program_info_macros(dst_path: str, main_title: str, subtitle: str, s
 
 def apply_rp2_replacements(dst_path: str, script_path: str) -> str:
     """SCRename.rp2の置換ルールを適用する"""
-    rp2_path = os.path.join(script_path, "SCRename.rp2")
-    if os.path.exists(rp2_path):
-        try:
-            with open(rp2_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith(":"):
-                        parts = line.split(",", 1)
-                        if len(parts) == 2:
-                            dst_path = dst_path.replace(parts[0], parts[1])
-        except Exception as e:
-            print(f"SCRename.rp2の読み込みでエラーが発生しました: {e}", file=sys.stderr)
-    return dst_path
+    return load_replace_rules(os.path.join(script_path, "SCRename.rp2")).apply(dst_path)
+
+@dataclass
+class RenameValues:
+    """リネーム書式のマクロに埋め込む値"""
+    stdt: datetime.datetime        # 開始日時
+    eddt: datetime.datetime        # 終了日時
+    number: Optional[str]          # 話数（"#1" 形式）
+    main_title: str
+    subtitle: Optional[str]
+    service_name: str
+
+# 日付・時刻マクロ（$SCdate$ 等。ed を付けると終了日時）
+DATE_MACROS: Dict[str, Callable[[datetime.datetime], str]] = {
+    "date": lambda dt: f"{dt.year % 100:02d}{dt.month:02d}{dt.day:02d}",
+    "date2": lambda dt: f"{dt.year:04d}{dt.month:02d}{dt.day:02d}",
+    "year": lambda dt: f"{dt.year % 100:02d}",
+    "year2": lambda dt: f"{dt.year:04d}",
+    "month": lambda dt: f"{dt.month:02d}",
+    "day": lambda dt: f"{dt.day:02d}",
+    "quarter": lambda dt: str((dt.month - 1) // 3 + 1),
+    "week": lambda dt: WEEK1[dt.weekday()],
+    "week2": lambda dt: WEEK2[dt.weekday()],
+    "week3": lambda dt: WEEK2[dt.weekday()].upper(),
+    "time": lambda dt: f"{dt.hour:02d}{dt.minute:02d}",
+    "time2": lambda dt: f"{dt.hour:02d}{dt.minute:02d}{dt.second:02d}",
+    "hour": lambda dt: f"{dt.hour:02d}",
+    "minute": lambda dt: f"{dt.minute:02d}",
+    "second": lambda dt: f"{dt.second:02d}",
+}
+
+# 5時前を前日の24時以降として扱う日付・時刻マクロ（$SCdates$ 等）
+ADJUSTED_DATE_MACROS: Dict[str, Callable[[datetime.datetime], str]] = {
+    f"{name}s": (lambda func: lambda dt: func(dt - datetime.timedelta(days=1) if dt.hour < 5 else dt))(DATE_MACROS[name])
+    for name in ("date", "date2", "year", "year2", "month", "day", "quarter", "week", "week2", "week3")
+}
+ADJUSTED_DATE_MACROS.update({
+    "times": lambda dt: f"{dt.hour + 24 if dt.hour < 5 else dt.hour:02d}{dt.minute:02d}",
+    "time2s": lambda dt: f"{dt.hour + 24 if dt.hour < 5 else dt.hour:02d}{dt.minute:02d}{dt.second:02d}",
+    "hours": lambda dt: f"{dt.hour + 24 if dt.hour < 5 else dt.hour:02d}",
+})
+
+# 同じ話数の桁数変換は1回だけ行う
+get_episode_numbers = functools.lru_cache(maxsize=256)(process_episode_number)
+
+# 番組情報マクロ
+PROGRAM_MACROS: Dict[str, Callable[[RenameValues], str]] = {
+    "number1": lambda v: get_episode_numbers(v.number)[0],
+    "number": lambda v: get_episode_numbers(v.number)[1],
+    "number2": lambda v: get_episode_numbers(v.number)[1],
+    "number3": lambda v: get_episode_numbers(v.number)[2],
+    "number4": lambda v: get_episode_numbers(v.number)[3],
+    "service": lambda v: v.service_name,
+    "part": lambda v: "",
+    "title": lambda v: v.main_title,
+    "title2": lambda v: v.main_title.replace(" ", "").upper(),
+    "subtitle": lambda v: v.subtitle if v.subtitle else "",
+}
+
+def get_macro(name: str) -> Optional[Callable[[RenameValues], str]]:
+    """マクロ名から値を求める関数を取得"""
+    if name in PROGRAM_MACROS:
+        return PROGRAM_MACROS[name]
+    for prefix, attr in (("ed", "eddt"), ("", "stdt")):
+        if name.startswith(prefix):
+            func = DATE_MACROS.get(name[len(prefix):]) or ADJUSTED_DATE_MACROS.get(name[len(prefix):])
+            if func:
+                return (lambda func, attr: lambda v: func(getattr(v, attr)))(func, attr)
+    return None
+
+class RenameTemplate:
+    """リネーム書式を文字列とマクロの列に分解したもの"""
+
+    def __init__(self, rename_format: str) -> None:
+        self.tokens: List[Tuple[bool, str]] = []  # (マクロか, 文字列またはマクロ名)
+        self.macros: Dict[str, Callable[[RenameValues], str]] = {}
+        pattern = re.compile(r"\$SC([0-9A-Za-z]+)\$")
+        pos = 0
+        search_pos = 0
+        while True:
+            m = pattern.search(rename_format, search_pos)
+            if m is None:
+                break
+            func = get_macro(m.group(1))
+            if func is None:
+                # 未定義のマクロは文字列として扱い、末尾の $ から再検索
+                search_pos = m.end() - 1
+                continue
+            if m.start() > pos:
+                self.tokens.append((False, rename_format[pos:m.start()]))
+            self.tokens.append((True, m.group(1)))
+            self.macros[m.group(1)] = func
+            pos = search_pos = m.end()
+        if pos < len(rename_format):
+            self.tokens.append((False, rename_format[pos:]))
+
+    def render(self, values: RenameValues) -> str:
+        """マクロを置換した文字列を生成（各マクロの値は1回だけ計算）"""
+        results = {name: func(values) for name, func in self.macros.items()}
+        return "".join(results[text] if is_macro else text for is_macro, text in self.tokens)
+
+@functools.lru_cache(maxsize=32)
+def compile_rename_format(rename_format: str) -> RenameTemplate:
+    """リネーム書式を解析（同じ書式は再利用）"""
+    return RenameTemplate(rename_format)
 
 def replace_invalid_chars(dst_path: str, rename_format: str) -> str:
     """使用不可文字を置換する"""
@@ -899,15 +2181,131 @@ def generate_full_path(dst_path: str, file_path: str, rpath: str) -> str:
         rpath = os.path.join(rpath, "")
     return os.path.join(rpath, dst_path)
 
-def process_file(file_path: str, rename_format: str, options: RenameOptions, service: List[List[str]]) -> bool:
-    """ファイル処理"""
+class FileTrace:
+    """1ファイル分の処理段階ごとの計測結果（-j オプション）"""
+
+    def __init__(self, file_path: Optional[str]) -> None:
+        self.file_path = file_path
+        self.start = time.perf_counter()
+        self.values: Dict[str, object] = {}
+        self.stages: List[Dict[str, object]] = []
+
+    def to_dict(self) -> Dict[str, object]:
+        """JSON に変換する内容を取得"""
+        record = {"file": self.file_path}
+        record.update(self.values)
+        record["elapsed"] = round(time.perf_counter() - self.start, 6)
+        record["stages"] = self.stages
+        return record
+
+_trace_local = threading.local()  # このスレッドの計測先（trace）と処理段階（stage）
+_trace_lock = threading.Lock()
+
+def new_trace(file_path: Optional[str], options: RenameOptions) -> Optional[FileTrace]:
+    """-j オプション指定時は計測を開始"""
+    return FileTrace(file_path) if options.trace else None
+
+def get_trace() -> Optional[FileTrace]:
+    """このスレッドの計測先を取得"""
+    return getattr(_trace_local, "trace", None)
+
+@contextmanager
+def use_trace(trace: Optional[FileTrace]):
+    """このスレッドの計測先を切り替える"""
+    previous = (get_trace(), getattr(_trace_local, "stage", None))
+    _trace_local.trace = trace
+    _trace_local.stage = None
+    try:
+        yield trace
+    finally:
+        _trace_local.trace, _trace_local.stage = previous
+
+@contextmanager
+def trace_stage(name: str):
+    """処理段階の時間・通信量・キャッシュ・リトライ回数を記録"""
+    trace = get_trace()
+    if trace is None:
+        yield
+        return
+    entry = {"stage": name, "time": 0.0, "requests": 0, "bytes": 0, "cache_hits": 0, "cache_misses": 0, "retries": 0}
+    trace.stages.append(entry)
+    parent = getattr(_trace_local, "stage", None)
+    _trace_local.stage = entry
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry["time"] = round(time.perf_counter() - start, 6)
+        _trace_local.stage = parent
+
+def trace_count(key: str, n: int = 1) -> None:
+    """計測中の処理段階の回数・バイト数を加算"""
+    entry = getattr(_trace_local, "stage", None)
+    if entry is not None:
+        entry[key] += n
+
+def trace_value(key: str, value: object) -> None:
+    """計測結果に解析結果などの値を記録"""
+    trace = get_trace()
+    if trace is not None:
+        trace.values[key] = value
+
+def write_trace(trace: Optional[FileTrace], destination: str) -> None:
+    """計測結果を1行の JSON として出力"""
+    if trace is None:
+        return
+    line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+    if destination == "-":
+        print(line, file=sys.stderr)
+        return
+    try:
+        with _trace_lock, open(destination, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"計測結果を書き込めませんでした: {e}", file=sys.stderr)
+
+class ThreadOutput:
+    """スレッドごとに出力先を切り替えられるストリーム"""
+
+    def __init__(self, stream) -> None:
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self) -> None:
+        buffer = getattr(self.local, "buffer", None)
+        (buffer if buffer is not None else self.stream).flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self.stream, name)
+
+    @contextmanager
+    def capture(self, buffer: io.StringIO):
+        """現在のスレッドの出力を buffer に切り替える"""
+        self.local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self.local.buffer = None
+
+def prepare_file(file_path: str, options: RenameOptions, service: List[List[str]], file_stat: Optional[Callable[[], os.stat_result]] = None) -> FileContext:
+    """ファイル名を解析して番組検索の準備を行う（file_stat はフォルダ走査で取得済みの stat を使う場合に指定）"""
     # ファイルパス、ファイル名、拡張子、タイトル開始位置取得
-    rpath, filename, ext = get_file_info(file_path)
-    print(f"Path: {rpath}, Filename: {filename}, Ext: {ext}", file=sys.stderr)
-    
-    # 日付取得（タイトル開始位置も同時に取得）
-    tgtdt, dtflag, days, title_pos = get_date_from_title(filename, options.start_pos)
-    print(f"Date: {tgtdt}, Flag: {dtflag}, Days: {days}, Title Position: {title_pos}", file=sys.stderr)
+    with trace_stage("parse"):
+        rpath, filename, ext = get_file_info(file_path)
+
+        # 日付取得（タイトル開始位置も同時に取得）
+        tgtdt, dtflag, days, title_pos = get_date_from_title(filename, options.start_pos, file_stat or (lambda: os.stat(file_path)))
+    trace_value("path", rpath)
+    trace_value("filename", filename)
+    trace_value("ext", ext)
+    trace_value("date", tgtdt)
+    trace_value("dtflag", dtflag)
+    trace_value("days", days)
+    trace_value("title_pos", title_pos)
     
     # コマンドライン引数で指定された位置を優先
     if options.start_pos > 0:
@@ -919,29 +2317,32 @@ def process_file(file_path: str, rename_format: str, options: RenameOptions, ser
 
     # SCRename.rp1ファイルの読み込みとファイル名置換
     script_path = os.path.dirname(sys.argv[0])
-    raw_title = load_replace_file(script_path, raw_title)
-    print(f"After RP1: {raw_title}", file=sys.stderr)
+    with trace_stage("rp1"):
+        raw_title = load_replace_file(script_path, raw_title)
+    trace_value("rp1", raw_title)
 
-    # ファイル名先頭部分削除
-    raw_title = remove_leading_chars(raw_title)
-    print(f"Raw Title: {raw_title}", file=sys.stderr)
+    with trace_stage("normalize"):
+        # ファイル名先頭部分削除
+        raw_title = remove_leading_chars(raw_title)
 
-    # 全角半角ローマ数字記号変換
-    normalized_title = convert_chars(raw_title)
-    print(f"Normalized Title: {normalized_title}", file=sys.stderr)
+        # 全角半角ローマ数字記号変換
+        normalized_title = convert_chars(raw_title)
 
-    # タイトル取得
-    main_title = get_title(normalized_title, options.search_len)
-    print(f"Main Title: {main_title}", file=sys.stderr)
+        # タイトル取得
+        main_title = get_title(normalized_title, options.search_len)
+    trace_value("raw_title", raw_title)
+    trace_value("normalized_title", normalized_title)
+    trace_value("main_title", main_title)
 
     # 放送局名取得
-    serv = get_service(normalized_title, main_title, service, options.start_pos)
-    if serv >= 0:
-        print(f"Service: {service[serv][0]} ({service[serv][1]})", file=sys.stderr)
-    else:
-        print("Service: Unknown", file=sys.stderr)
+    with trace_stage("service"):
+        serv = get_service(normalized_title, main_title, service, options.start_pos)
+    trace_value("service", service[serv][:2] if serv >= 0 else None)
 
-    # 番組検索
+    return FileContext(file_path, rpath, filename, ext, tgtdt, dtflag, days, normalized_title, main_title, serv)
+
+def resolve_file(ctx: FileContext, options: RenameOptions, service: List[List[str]], feeds: Optional[FeedPlan] = None) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[datetime.datetime], Optional[datetime.datetime]]:
+    """番組情報を検索"""
     program_info = None
     subtitle = None
     number = None
@@ -950,17 +2351,29 @@ def process_file(file_path: str, rename_format: str, options: RenameOptions, ser
 
     # -a1オプションが指定されていない場合は通常の番組情報検索を実行
     if not options.recursive_search:
-        program_info, subtitle, number, stdt, eddt = search_program(main_title, tgtdt, days, serv, service, options, dtflag)
+        program_info, subtitle, number, stdt, eddt = search_program(ctx.main_title, ctx.tgtdt, ctx.days, ctx.serv, service, options, ctx.dtflag, feeds)
 
     # 通常の検索で見つからない場合、または-a1オプションが指定されている場合は話数検索を実行
     if not program_info and (options.search_episode or options.recursive_search):
         print("話数検索を行います。\n", file=sys.stderr)
-        program_info, subtitle, number, stdt, eddt = search_episode_info(normalized_title, main_title, serv, service, options)
+        with trace_stage("episode"):
+            program_info, subtitle, number, stdt, eddt = search_episode_info(ctx.normalized_title, ctx.main_title, ctx.serv, service, options)
+
+    return program_info, subtitle, number, stdt, eddt
+
+def build_dst_path(ctx: FileContext, rename_format: str, options: RenameOptions, service: List[List[str]], program: Tuple[Optional[str], Optional[str], Optional[str], Optional[datetime.datetime], Optional[datetime.datetime]]) -> Optional[str]:
+    """番組情報からリネーム先のパスを生成"""
+    program_info, subtitle, number, stdt, eddt = program
+    main_title = ctx.main_title
+    normalized_title = ctx.normalized_title
+    tgtdt = ctx.tgtdt
+    serv = ctx.serv
+    script_path = os.path.dirname(sys.argv[0])
 
     if not program_info:
         if not options.force_rename:
             print(f"{main_title} の番組情報が見つかりませんでした。", file=sys.stderr)
-            return False
+            return None
         else:
             print("強制リネームを行います。\n", file=sys.stderr)
             # 強制リネーム時の処理
@@ -976,7 +2389,7 @@ def process_file(file_path: str, rename_format: str, options: RenameOptions, ser
         # サブタイトル必須の処理
         if options.require_subtitle and not subtitle:
             print(f"{program_info} のサブタイトルを取得できなかったため処理を中止しました。", file=sys.stderr)
-            return False
+            return None
         # 番組情報から取得した時刻を使用
         if not stdt:
             stdt = tgtdt
@@ -985,30 +2398,14 @@ def process_file(file_path: str, rename_format: str, options: RenameOptions, ser
         # 番組情報から取得したタイトルを使用
         main_title = program_info
 
-    # リネーム書式設定
-    dst_path = rename_format
-    
-    # 話数処理
-    number1, number2, number3, number4 = process_episode_number(number)
-    dst_path = dst_path.replace("$SCnumber1$", number1)
-    dst_path = dst_path.replace("$SCnumber$", number2)
-    dst_path = dst_path.replace("$SCnumber2$", number2)
-    dst_path = dst_path.replace("$SCnumber3$", number3)
-    dst_path = dst_path.replace("$SCnumber4$", number4)
-
-    # 開始時刻の置換
-    dst_path = replace_date_time_macros(dst_path, stdt, "")
-
-    # 終了時刻の置換
-    dst_path = replace_date_time_macros(dst_path, eddt, "ed")
-
     # (Linux環境用)タイトル放送局名の使用不可文字置換
     main_title = replace_invalid_char_for_title(main_title)
     subtitle = replace_invalid_char_for_title(subtitle)
 
-    # 放送局名の置換
+    # リネーム書式のマクロ置換（話数・日時・番組情報・放送局名）
     service_name = service[serv][2] if serv >= 0 else ""
-    dst_path = replace_program_info_macros(dst_path, main_title, subtitle, service_name)
+    values = RenameValues(stdt, eddt, number, main_title, subtitle, service_name)
+    dst_path = compile_rename_format(rename_format).render(values)
 
     # SCRename.rp2 読み込み＆リネーム名置換
     dst_path = apply_rp2_replacements(dst_path, script_path)
@@ -1021,22 +2418,177 @@ def process_file(file_path: str, rename_format: str, options: RenameOptions, ser
         dst_path = remove_unnecessary_spaces(dst_path)
 
     # フルパス生成
-    dst_path = generate_full_path(dst_path, file_path, rpath)
+    dst_path = generate_full_path(dst_path, ctx.file_path, ctx.rpath)
 
     # 256文字以上ファイルパス削除
-    max_len = 255 - len(ext)
+    max_len = 255 - len(ctx.ext)
     if len(dst_path) > max_len:
         print("ファイルパスが256文字以上のため切り詰めます。", file=sys.stderr)
         dst_path = dst_path[:max_len]
     
+    return dst_path + ctx.ext
+
+def process_file(file_path: str, rename_format: str, options: RenameOptions, service: List[List[str]]) -> bool:
+    """ファイル処理"""
+    ctx = prepare_file(file_path, options, service)
+    reset_offline_miss()
+    program = resolve_file(ctx, options, service)
+    if program[0] is None and offline_missed() and not options.test_mode:
+        add_retry(file_path, rename_format, options)
+        return False
+    with trace_stage("format"):
+        dst_path = build_dst_path(ctx, rename_format, options, service, program)
+    if dst_path is None:
+        return False
+
     # リネーム実行
-    return rename_file(file_path, dst_path + ext, options)
+    with trace_stage("rename"):
+        return rename_file(file_path, dst_path, options)
+
+def process_files(file_paths: List[str], rename_format: str, options: RenameOptions, service: List[List[str]],
+                  plan: Optional[List["PlanEntry"]] = None, entries: Optional[Dict[str, os.DirEntry]] = None) -> List[Optional[str]]:
+    """複数ファイルを一括処理し、ファイルごとのリネーム先を返す（rss2.php の取得をまとめて行う）
 
-def load_service_file(script_path: str) -> List[List[str]]:
-    """SCRename.srvファイルを読み込み、サービス情報を返す"""
+    plan を指定するとリネームは行わず、リネーム計画を plan に追加する。
+    entries はフォルダ走査で見つけたファイル（対象外の判定済み）で、stat の結果を日時の取得に再利用する。
+    """
+    script_path = os.path.dirname(sys.argv[0])
+    renamed: List[Optional[str]] = [None] * len(file_paths)
+    # 最後に表示する通信・キャッシュの件数は、この一括処理の分だけにする
+    stats_start = _http_client.stats if _http_client else RequestStats()
+    cache_start = (_response_cache.hits, _response_cache.misses) if _response_cache else (0, 0)
+
+    # 全ファイルの日付・放送局を先に解析
+    contexts: List[Optional[FileContext]] = []
+    traces = [new_trace(file_path, options) for file_path in file_paths]
+    for file_path, trace in zip(file_paths, traces):
+        ctx = None
+        entry = entries.get(file_path) if entries else None
+        with use_trace(trace):
+            with trace_stage("config"):
+                excluded = entry is None and is_excluded_file(script_path, file_path)
+            if excluded:
+                print(file_path)
+                print("対象外のファイルのため処理しませんでした。", file=sys.stderr)
+                trace_value("excluded", True)
+            elif entry is None and not options.test_mode and not os.path.exists(file_path):
+                print(f"{file_path} がありません。", file=sys.stderr)
+            else:
+                try:
+                    ctx = prepare_file(file_path, options, service, entry.stat if entry else None)
+                except SystemExit:
+                    pass
+        contexts.append(ctx)
+
+    # 検索期間を結合して rss2.php をまとめて取得（計測結果はファイルに属さないものとして出力）
+    feeds = FeedPlan()
+    if not options.recursive_search:
+        for ctx in contexts:
+            if ctx and ctx.main_title:
+                feeds.add(*get_search_window(ctx.tgtdt, ctx.days))
+        feed_trace = new_trace(None, options)
+        with use_trace(feed_trace):
+            feeds.fetch(MAX_WORKERS)
+        write_trace(feed_trace, options.trace)
+
+    # 取得済みフィードから各ファイルを並列に検索
+    # （メッセージはファイルごとに溜めて、リネームと同じ順番で出力する）
+    stderr = ThreadOutput(sys.stderr)
+
+    def resolve(ctx: FileContext, trace: Optional[FileTrace]):
+        with stderr.capture(io.StringIO()) as buffer, use_trace(trace):
+            reset_offline_miss()
+            program = resolve_file(ctx, options, service, feeds)
+        return program, buffer.getvalue(), offline_missed()
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    targets = [(i, ctx) for i, ctx in enumerate(contexts) if ctx is not None]
+    sys.stderr = stderr
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = list(executor.map(resolve, [ctx for _, ctx in targets], [traces[i] for i, _ in targets]))
+    finally:
+        sys.stderr = stderr.stream
+
+    # ファイルの指定順にリネーム先を決め、別ドライブへの移動に時間がかかるため MOVE_WORKERS 件ずつ並列に移動する
+    # （同じリネーム先のファイルは指定順に1つずつ移動し、出力はファイルの指定順に行う）
+    results = dict(zip([i for i, _ in targets], results))
+    stdout = ThreadOutput(sys.stdout)
+    dst_paths: Dict[int, str] = {}
+    moves: Dict[str, List[int]] = {}   # 正規化したリネーム先 → ファイル番号
+
+    def move(indexes: List[int]) -> Dict[int, Tuple[str, str]]:
+        done = {}
+        for i in indexes:
+            with stdout.capture(io.StringIO()) as out, stderr.capture(io.StringIO()) as err:
+                if plan is not None:
+                    print(dst_paths[i])
+                    renamed[i] = dst_paths[i]
+                else:
+                    with use_trace(traces[i]), trace_stage("rename"):
+                        if rename_file(contexts[i].file_path, dst_paths[i], options, stderr.stream):
+                            renamed[i] = dst_paths[i]
+            done[i] = (out.getvalue(), err.getvalue())
+        return done
+
+    sys.stdout, sys.stderr = stdout, stderr
+    try:
+        outputs: Dict[int, Tuple[str, str]] = {}
+        for i, (ctx, trace) in enumerate(zip(contexts, traces)):
+            if ctx is None:
+                continue
+            program, messages, missed = results[i]
+            with stdout.capture(io.StringIO()) as out, stderr.capture(io.StringIO()) as err:
+                err.write(messages)
+                if program[0] is None and missed and not options.test_mode and plan is None:
+                    add_retry(ctx.file_path, rename_format, options)
+                else:
+                    with use_trace(trace), trace_stage("format"):
+                        dst_path = build_dst_path(ctx, rename_format, options, service, program)
+                    if dst_path is not None:
+                        dst_paths[i] = dst_path
+                        if plan is not None:
+                            title, subtitle, number, stdt, eddt = program
+                            plan.append(PlanEntry(os.path.abspath(ctx.file_path), os.path.abspath(dst_path), title, subtitle, number,
+                                                  stdt.isoformat(sep=" ") if stdt else None, eddt.isoformat(sep=" ") if eddt else None))
+                        moves.setdefault(os.path.normcase(os.path.abspath(dst_path)), []).append(i)
+            outputs[i] = (out.getvalue(), err.getvalue())
+
+        with ThreadPoolExecutor(max_workers=MOVE_WORKERS) as executor:
+            futures = {}
+            for indexes in moves.values():
+                future = executor.submit(move, indexes)
+                futures.update((i, future) for i in indexes)
+            for i, (ctx, trace) in enumerate(zip(contexts, traces)):
+                if ctx is not None:
+                    for out, err in (outputs[i], futures[i].result()[i] if i in futures else ("", "")):
+                        stdout.stream.write(out)
+                        stdout.stream.flush()
+                        stderr.stream.write(err)
+                write_trace(trace, options.trace)
+    finally:
+        sys.stdout, sys.stderr = stdout.stream, stderr.stream
+
+    if _response_cache:
+        print(f"キャッシュ: ヒット {_response_cache.hits - cache_start[0]} 件 / ミス {_response_cache.misses - cache_start[1]} 件", file=sys.stderr)
+    stats = _http_client.stats - stats_start if _http_client else RequestStats()
+    if stats.requests:
+        print(f"通信: {stats.requests} 件 / 受信 {stats.wire_bytes} バイト（展開後 {stats.body_bytes} バイト） / {stats.latency:.2f} 秒", file=sys.stderr)
+    return renamed
+
+
+_service_tables: Dict[str, Tuple[int, ServiceTable]] = {}
+
+def load_service_file(script_path: str) -> ServiceTable:
+    """SCRename.srvファイルを読み込み、サービス情報を返す（更新されていなければ前回の結果を再利用）"""
     service = []
     srv_path = os.path.join(script_path, "SCRename.srv")
     try:
+        mtime = os.stat(srv_path).st_mtime_ns
+        cached = _service_tables.get(srv_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
         with open(srv_path, "r", encoding="utf-8") as f:
             for line in f:
                 line = line.strip()
@@ -1046,9 +2598,36 @@ def load_service_file(script_path: str) -> List[List[str]]:
                         service.append(parts[:4])
     except FileNotFoundError:
         print(f"{srv_path} がありません。", file=sys.stderr)
-        time.sleep(1)
         sys.exit(1)
-    return service
+    table = ServiceTable(service)
+    _service_tables[srv_path] = (mtime, table)
+    return table
+
+_exclusions: Dict[str, Tuple[int, List[str]]] = {}
+
+def load_exclusions(script_path: str) -> List[str]:
+    """SCRename.excファイルを読み込む（更新されていなければ前回の結果を再利用）"""
+    exc_path = os.path.join(script_path, "SCRename.exc")
+    try:
+        mtime = os.stat(exc_path).st_mtime_ns
+    except OSError:
+        return []
+    cached = _exclusions.get(exc_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    exclusions = []
+    with open(exc_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith(":"):
+                exclusions.append(line.upper())
+    _exclusions[exc_path] = (mtime, exclusions)
+    return exclusions
+
+def is_excluded_file(script_path: str, file_path: str) -> bool:
+    """SCRename.exc の定義に該当するファイルか判定"""
+    file_path = file_path.upper()
+    return any(x in file_path for x in load_exclusions(script_path))
 
 def search_episode_info(normalized_title: str, main_title: str, serv: int, service: List[List[str]], options: RenameOptions) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[datetime.datetime], Optional[datetime.datetime]]:
     """話数検索を行う"""
@@ -1087,7 +2666,7 @@ def search_episode_info(normalized_title: str, main_title: str, serv: int, servi
     title2 = title.replace(" ", "").upper()
 
     # SCRename.tidファイルからTIDを取得
-    tid, tid_title = get_tid_from_cache(title, title2)
+    tid, tid_title, mirrored = get_tid_from_cache(title, title2)
 
     # しょぼいカレンダーからTIDを取得
     if tid is None:
@@ -1095,18 +2674,11 @@ def search_episode_info(normalized_title: str, main_title: str, serv: int, servi
         encoded_title = urllib.parse.quote(title.encode("utf-8"))
 
         # しょぼいカレンダーにアクセス
-        for i in range(3):
-            if i > 0:
-                time.sleep(1)
-            try:
-                with urllib.request.urlopen(f"http://cal.syoboi.jp/find?kw={encoded_title}") as response:
-                    content = response.read().decode("utf-8")
-                    break
-            except Exception as e:
-                if i == 2:  # 最後の試行でエラー
-                    print("しょぼいカレンダーにアクセスできませんでした。", file=sys.stderr)
-                    return None, None, None, None, None
-                continue
+        try:
+            content = open_url(f"http://cal.syoboi.jp/find?kw={encoded_title}")
+        except Exception as e:
+            print("しょぼいカレンダーにアクセスできませんでした。", file=sys.stderr)
+            return None, None, None, None, None
 
         # TIDを取得
         i = len(content)
@@ -1130,7 +2702,9 @@ def search_episode_info(normalized_title: str, main_title: str, serv: int, servi
             i -= 1
 
         if i < 0:
-            print(f"「{title}」の TID を取得できませんでした。\n", file=sys.stderr)
+            print(f"「{title}」の TID を取得できませんでした。", file=sys.stderr)
+            print_similar_titles(title2)
+            print(file=sys.stderr)
             return None, None, None, None, None
 
         # TIDキャッシュを更新
@@ -1146,59 +2720,859 @@ def search_episode_info(normalized_title: str, main_title: str, serv: int, servi
         print(f"「{tid_title}」の TID（{tid}）を取得しました。", file=sys.stderr)
         print(f"第{episode_number}話の情報を検索します。\n", file=sys.stderr)
 
-    # しょぼいカレンダーから話数情報を取得
-    for i in range(3):
-        if i > 0:
-            time.sleep(1)
+    # しょぼいカレンダーから話数情報を取得（同じ TID の全話をまとめて取得）
+    episodes = get_episode_list(tid, service[serv][3] if serv >= 0 else "")
+    if episodes is None:
+        return None, None, None, None, None
+
+    episode = episodes.get(episode_number)
+    if episode is None and mirrored:
+        # 同期したタイトル一覧のTIDは同名の別シリーズの場合があるため、しょぼいカレンダーで検索し直す
+        web_tid, web_title = search_tid_from_web(title, title2)
+        if web_tid is not None:
+            print(f"「{web_title}」の TID（{web_tid}）を取得しました。\n", file=sys.stderr)
+            update_tid_cache(web_tid, web_title)
+        if web_tid is not None and web_tid != tid:
+            tid, tid_title = web_tid, web_title
+            episodes = get_episode_list(tid, service[serv][3] if serv >= 0 else "")
+            episode = episodes.get(episode_number) if episodes is not None else None
+
+    if episode is not None:
+        stdt, eddt = episode.start, episode.end
+        if episode.ch_id.isdigit():
+            serv = as_service_table(service).find_chid(episode.ch_id, serv)
+        subtitle = episode.subtitle
+
+        return tid_title, subtitle, f"#{episode_number}", stdt, eddt
+
+    return None, None, None, None, None
+
+_retry_lock = threading.Lock()
+
+def get_retry_path() -> str:
+    """再処理待ちの一覧（SCRename.retry）のパスを取得"""
+    return os.path.join(os.path.dirname(sys.argv[0]), RETRY_FILE)
+
+def add_retry(file_path: str, rename_format: str, options: RenameOptions) -> None:
+    """オフラインで処理できなかったファイルを SCRename.retry に追加"""
+    job = {"file": os.path.abspath(file_path), "format": rename_format, "options": asdict(options)}
+    try:
+        with _retry_lock, open(get_retry_path(), "a", encoding="utf-8") as f:
+            f.write(json.dumps(job, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"{RETRY_FILE} に書き込めませんでした: {e}", file=sys.stderr)
+        return
+    print(f"オフラインのため番組情報を取得できませんでした。{RETRY_FILE} に追加しました。", file=sys.stderr)
+
+def build_title_lookup_url(last_update: Optional[str] = None) -> str:
+    """db.php の TitleLookup の検索URLを生成（last_update 以降に更新されたタイトルのみ）"""
+    update_param = ""
+    if last_update:
+        digits = re.sub(r"\D", "", last_update)[:14].ljust(14, "0")
+        update_param = f"&LastUpdate={digits[:8]}_{digits[8:]}-"
+    return f"http://cal.syoboi.jp/db.php?Command=TitleLookup&TID=*{update_param}&Fields=TID,LastUpdate,Title"
+
+def parse_title_list(content: str) -> List[Tuple[int, str, str]]:
+    """db.php（TitleLookup）の応答を解析し、（TID, タイトル, 更新日時）の一覧を取得"""
+    items = []
+    i = content.find("<TitleItem")
+    while i >= 0:
+        j = content.find("</TitleItem>", i)
+        if j < 0:
+            break
+        item = content[i:j]
+        tid = get_xml_text(item, "TID")
+        title = get_xml_text(item, "Title")
+        if tid.isdigit() and title:
+            # find?kw= の検索結果と同じ変換を行う
+            title = title.replace("\\", "＼")
+            for k in range(len(CHAR9)):
+                title = title.replace(f"&{CHAR9[k]};", CHAR10[k])
+            title = title.replace("?", "？").replace("!", "！")
+            items.append((int(tid), title, get_xml_text(item, "LastUpdate")))
+        i = content.find("<TitleItem", j + 12)
+    return items
+
+def run_title_sync() -> None:
+    """-u オプション: しょぼいカレンダーのタイトル一覧を SCRename.db に同期（前回以降に更新された分のみ）"""
+    store = get_tid_store()
+    if store is None:
+        sys.exit(1)
+    last_update = store.get_meta("title_last_update")
+    url = build_title_lookup_url(last_update)
+    try:
+        if is_offline(get_host(url)):
+            raise OfflineError(f"オフラインのため取得できません: {url}")
+        items = parse_title_list(fetch_url(url).decode("utf-8"))
+        total = store.sync_titles(items)
+    except Exception as e:
+        print(f"タイトル一覧を取得できませんでした: {e}", file=sys.stderr)
+        sys.exit(1)
+    since = f"{last_update} 以降に更新された" if last_update else ""
+    print(f"{since}タイトル {len(items)} 件を同期しました（合計 {total} 件）。", file=sys.stderr)
+
+def run_retry() -> None:
+    """-r オプション: SCRename.retry のファイルを再処理（処理できないファイルが残った場合は終了コード 1）"""
+    retry_path = get_retry_path()
+    work_path = retry_path + ".work"
+    # 処理中に追加された分と混ざらないよう一覧を退避してから処理する（前回中断した分も含める）
+    lines = []
+    for path in (work_path, retry_path):
         try:
-            with urllib.request.urlopen(f"http://cal.syoboi.jp/db.php?Command=ProgLookup&TID={tid}{service_param}&Count={episode_number}&Fields=StTime,EdTime,ChID,STSubTitle&JOIN=SubTitles") as response:
-                content = response.read().decode("utf-8")
-                break
-        except Exception as e:
-            if i == 2:  # 最後の試行でエラー
-                print("しょぼいカレンダーにアクセスできませんでした。", file=sys.stderr)
-                return None, None, None, None, None
+            with open(path, "r", encoding="utf-8") as f:
+                lines.extend(f)
+        except FileNotFoundError:
+            pass
+    if not lines:
+        print("再処理するファイルはありません。", file=sys.stderr)
+        return
+    with open(work_path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    if os.path.exists(retry_path):
+        os.unlink(retry_path)
+
+    # 同じファイルは最後に追加されたものを使い、書式・オプションごとにまとめて処理
+    jobs: Dict[str, dict] = {}
+    for line in lines:
+        try:
+            job = json.loads(line)
+            jobs[job["file"]] = job
+        except (ValueError, KeyError, TypeError):
             continue
+    groups: Dict[str, List[str]] = {}
+    failed = False
+    for file_path, job in jobs.items():
+        if not os.path.exists(file_path):
+            print(f"{file_path} がありません。", file=sys.stderr)
+            failed = True
+            continue
+        key = json.dumps([job["format"], job.get("options", {})], ensure_ascii=False, sort_keys=True)
+        groups.setdefault(key, []).append(file_path)
+
+    service = load_service_file(os.path.dirname(sys.argv[0]))
+    names = {x.name for x in fields(RenameOptions)}
+    for key, file_paths in groups.items():
+        rename_format, job_options = json.loads(key)
+        options = RenameOptions(**{k: v for k, v in job_options.items() if k in names})
+        if None in process_files(file_paths, rename_format, options, service) and not options.force_rename:
+            failed = True
+    os.unlink(work_path)
+
+    # オフラインのまま再び SCRename.retry に記録されたファイルも失敗とする（-f 指定時も同様）
+    try:
+        with open(retry_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    if json.loads(line)["file"] in jobs:
+                        failed = True
+                        break
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    if failed:
+        sys.exit(1)
 
-    # 話数情報を解析
-    i = content.find("<StTime>")
-    if i > 0:
-        i += 8
-        j = content.find("</StTime>", i)
-        start_time = content[i:j].replace("-", "/")
-        if start_time:
-            stdt = datetime.datetime.strptime(start_time, "%Y/%m/%d %H:%M:%S")
-
-        i = content.find("<EdTime>", j + 9) + 8
-        j = content.find("</EdTime>", i)
-        end_time = content[i:j].replace("-", "/")
-        if end_time:
-            eddt = datetime.datetime.strptime(end_time, "%Y/%m/%d %H:%M:%S")
-
-        i = content.find("<ChID>", j + 9) + 6
-        j = content.find("</ChID>", i)
-        ch_id = content[i:j]
-        if ch_id.isdigit():
-            for i in range(len(service)):
-                if service[i][3] == ch_id:
-                    serv = i
-                    break
+@dataclass
+class Reservation:
+    """先読みする録画予約"""
+    title: str                     # 番組名
+    serv: int                      # 放送局番号（不明な場合は -1）
+    start: datetime.datetime       # 録画開始日時
+    count: Optional[int]           # 話数（不明な場合は None）
+
+def parse_reservation_time(text: str) -> Optional[datetime.datetime]:
+    """予約リストの開始日時（YYYY-MM-DD HH:MM[:SS]、YYYY/MM/DD HH:MM[:SS]、YYYYMMDDHHMM）を解析"""
+    text = text.strip()
+    if len(text) == 12 and text.isdigit():
+        text = f"{text[:4]}-{text[4:6]}-{text[6:8]} {text[8:10]}:{text[10:]}"
+    try:
+        return datetime.datetime.fromisoformat(text.replace("/", "-"))
+    except ValueError:
+        return None
+
+def load_reservations(path: str, service: ServiceTable) -> List[Reservation]:
+    """予約リスト（番組名,放送局またはChID,開始日時[,話数] のCSV）を読み込む"""
+    import csv
+
+    reservations = []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for line_no, row in enumerate(csv.reader(f), 1):
+            if not row or not row[0].strip() or row[0].startswith(":"):
+                continue
+            start = parse_reservation_time(row[2]) if len(row) > 2 else None
+            if start is None:
+                # 見出し行などは読み飛ばす
+                print(f"{path} の {line_no} 行目を読み飛ばしました。", file=sys.stderr)
+                continue
+            name = row[1].strip()
+            if name.isdigit():
+                serv = service.find_chid(name)
+            else:
+                serv = service.find(0, name)
+                if serv < 0:
+                    serv = service.find(1, name)
+            count = row[3].strip() if len(row) > 3 else ""
+            reservations.append(Reservation(convert_chars(row[0].strip()), serv, start, int(count) if count.isdigit() else None))
+    return reservations
+
+def prefetch_url(url: str, until: datetime.datetime) -> bool:
+    """URLの内容を取得し、until まではキャッシュに残す"""
+    min_ttl = (until - datetime.datetime.now()).total_seconds()
+    try:
+        open_url_bytes(url, min_ttl, refresh=True)
+        return True
+    except Exception as e:
+        print(f"検索エラー: {e}", file=sys.stderr)
+        return False
 
-        i = content.find("<STSubTitle>", j + 7) + 12
-        j = content.find("</STSubTitle>", i)
-        subtitle = content[i:j]
+def prefetch_feed(start: datetime.datetime, days: int, until: datetime.datetime) -> bool:
+    """番組表を取得し、until まではキャッシュに残す"""
+    min_ttl = (until - datetime.datetime.now()).total_seconds()
+    try:
+        fetch_feed(start, days, min_ttl, refresh=True)
+        return True
+    except Exception as e:
+        print(f"検索エラー: {e}", file=sys.stderr)
+        return False
 
-        # HTMLエンティティを変換
-        for i in range(len(CHAR9)):
-            subtitle = subtitle.replace(f"&{CHAR9[i]};", CHAR10[i])
+def run_prefetch(argv: List[str], options: RenameOptions) -> None:
+    """-p オプション: 録画予約の番組情報を先に取得してキャッシュしておく"""
+    if len(argv) < 1:
+        print("パラメータが足りません。", file=sys.stderr)
+        sys.exit(1)
+    script_path = os.path.dirname(sys.argv[0])
+    service = load_service_file(script_path)
+    try:
+        reservations = load_reservations(argv[0], service)
+    except OSError as e:
+        print(f"予約リストを読み込めません: {e}", file=sys.stderr)
+        sys.exit(1)
 
-        return tid_title, subtitle, f"#{episode_number}", stdt, eddt
+    # 録画終了時のファイル名（開始日時付き）での検索で使う日の番組表と URL を取得する
+    days: Dict[datetime.datetime, datetime.datetime] = {}
+    urls: Dict[str, datetime.datetime] = {}
+    for r in reservations:
+        until = r.start + datetime.timedelta(seconds=PREFETCH_KEEP)
+        if not options.recursive_search:
+            start, search_days = get_search_window(r.start, 1)
+            for day in (start + datetime.timedelta(days=i) for i in range(search_days)):
+                days[day] = max(days.get(day, until), until)
+        if r.count is not None and (options.search_episode or options.recursive_search):
+            title2 = normalize_title(r.title)
+            tid, tid_title, _ = get_tid_from_cache(r.title, title2)
+            if tid is None:
+                tid, tid_title = search_tid_from_web(r.title, title2)
+                if tid is not None:
+                    update_tid_cache(tid, tid_title)
+            if tid is None:
+                print(f"「{r.title}」の TID を取得できませんでした。", file=sys.stderr)
+                print_similar_titles(title2)
+                continue
+            print(f"「{tid_title}」の TID（{tid}）を取得しました。", file=sys.stderr)
+            url = build_prog_lookup_url(tid, service[r.serv][3] if r.serv >= 0 else "")
+            urls[url] = max(urls.get(url, until), until)
+
+    # 連続した日は RSS_MAX_DAYS 日ずつまとめて取得
+    feeds: List[List] = []
+    for day in sorted(days):
+        if feeds and feeds[-1][0] + datetime.timedelta(days=feeds[-1][1]) == day and feeds[-1][1] < RSS_MAX_DAYS:
+            feeds[-1][1] += 1
+            feeds[-1][2] = max(feeds[-1][2], days[day])
+        else:
+            feeds.append([day, 1, days[day]])
 
-    return None, None, None, None, None
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        feed_results = executor.map(lambda x: prefetch_feed(*x), feeds)
+        url_results = executor.map(prefetch_url, urls, urls.values())
+        results = list(feed_results) + list(url_results)
+    print(f"予約 {len(reservations)} 件の番組情報を {sum(results)} / {len(results)} 件取得しました。", file=sys.stderr)
+    if not all(results):
+        sys.exit(1)
+
+def scan_files(folder: str, script_path: str, produced: Optional[set] = None) -> Iterator[os.DirEntry]:
+    """フォルダ以下を再帰的に走査し、リネーム対象のファイルを見つけた順に返す
+
+    produced（正規化したパス）に含まれるファイルは、走査中にリネームしたものとして除外する。
+    拡張子と SCRename.exc で先に絞り込み、一覧は1フォルダ分ずつしか作らない。
+    """
+    stack = [folder]
+    while stack:
+        subdirs = []
+        files = []
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif (os.path.splitext(entry.name)[1].lower() in SCAN_EXTENSIONS and entry.is_file()
+                              and not is_excluded_file(script_path, entry.path)
+                              and not (produced and os.path.normcase(os.path.abspath(entry.path)) in produced)):
+                            files.append(entry)
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f"フォルダを読み込めません: {e}", file=sys.stderr)
+            continue
+        # 走査順はファイルシステムによって異なるため、フォルダごとに名前順で処理する（フォルダは逆順に積む）
+        yield from sorted(files, key=lambda x: x.name)
+        stack.extend(sorted(subdirs, reverse=True))
+
+def process_targets(paths: List[str], rename_format: str, options: RenameOptions, service: List[List[str]],
+                    plan: Optional[List["PlanEntry"]] = None) -> List[Optional[str]]:
+    """ファイル・フォルダの指定を一括処理する（フォルダは走査しながら SCAN_BATCH 件ずつ処理）"""
+    script_path = os.path.dirname(sys.argv[0])
+    renamed: List[Optional[str]] = []
+    batch: List[str] = []
+    entries: Dict[str, os.DirEntry] = {}
+    produced = set()   # リネーム後のファイル（走査中のフォルダに移動したものを再び処理しない）
+
+    def flush() -> None:
+        results = process_files(batch, rename_format, options, service, plan, entries)
+        produced.update(os.path.normcase(os.path.abspath(x)) for x in results if x)
+        renamed.extend(results)
+        batch.clear()
+        entries.clear()
+
+    for path in paths:
+        if not os.path.isdir(path):
+            batch.append(path)
+            continue
+        for entry in scan_files(path, script_path, produced):
+            batch.append(entry.path)
+            entries[entry.path] = entry
+            if len(batch) >= SCAN_BATCH:
+                flush()
+    if batch:
+        flush()
+    return renamed
+
+def run_batch(argv: List[str], options: RenameOptions) -> None:
+    """-b オプション: 複数ファイルを一括でリネーム"""
+    if len(argv) < 2:
+        print("パラメータが足りません。", file=sys.stderr)
+        sys.exit(1)
+    elif not argv[0]:
+        print("リネーム書式が指定されていません。", file=sys.stderr)
+        sys.exit(1)
+
+    # SCRename.srv 読み込み
+    service = load_service_file(os.path.dirname(sys.argv[0]))
+
+    if None in process_targets(argv[1:], argv[0], options, service):
+        if not options.force_rename:
+            sys.exit(1)
+
+@dataclass
+class PlanEntry:
+    """リネーム計画の1ファイル分"""
+    src: str                       # リネーム元のパス
+    dst: str                       # リネーム先のパス
+    title: Optional[str]           # 番組名
+    subtitle: Optional[str]        # サブタイトル
+    number: Optional[str]          # 話数
+    start: Optional[str]           # 開始日時（YYYY-MM-DD HH:MM:SS）
+    end: Optional[str]             # 終了日時（YYYY-MM-DD HH:MM:SS）
+
+class PlanJournal:
+    """リネーム計画の実行記録（1行ごとに fsync し、中断後の再開・取り消しに使う）"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, **record) -> None:
+        """記録を1行追加"""
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        self.file.close()
+
+    def record(self, plan: List["PlanEntry"], index: int, state: str) -> None:
+        """計画の index 番目の状態を記録（別の計画の記録と区別するためリネーム元・先も記録）"""
+        self.write(index=index, state=state, src=plan[index].src, dst=plan[index].dst)
+
+    @staticmethod
+    def read(path: str, plan: List["PlanEntry"]) -> Tuple[Dict[int, str], List[str]]:
+        """記録を読み込み、（計画の番号 → 最後の状態, 作成したフォルダ）を返す（plan と一致しない記録は無視する）"""
+        states: Dict[int, str] = {}
+        dirs: List[str] = []
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue   # 書き込み途中で中断した行
+                    if "mkdir" in record:
+                        dirs.append(record["mkdir"])
+                    elif "index" in record:
+                        i = record["index"]
+                        if (isinstance(i, int) and 0 <= i < len(plan)
+                                and record.get("src") == plan[i].src and record.get("dst") == plan[i].dst):
+                            states[i] = record["state"]
+        except FileNotFoundError:
+            pass
+        return states, dirs
+
+def get_journal_path(plan_path: str) -> str:
+    """リネーム計画の実行記録のパスを取得"""
+    return plan_path + ".journal"
+
+def load_plan(plan_path: str) -> List[PlanEntry]:
+    """リネーム計画を読み込む"""
+    names = {x.name for x in fields(PlanEntry)}
+    with open(plan_path, "r", encoding="utf-8") as f:
+        return [PlanEntry(**{k: v for k, v in json.loads(line).items() if k in names}) for line in f if line.strip()]
+
+def run_plan(argv: List[str], plan_path: str, options: RenameOptions) -> None:
+    """-plan= オプション: 複数ファイルのリネーム先を決めてリネーム計画に保存（リネームは行わない）"""
+    if len(argv) < 2:
+        print("パラメータが足りません。", file=sys.stderr)
+        sys.exit(1)
+    elif not argv[0]:
+        print("リネーム書式が指定されていません。", file=sys.stderr)
+        sys.exit(1)
+
+    service = load_service_file(os.path.dirname(sys.argv[0]))
+    plan: List[PlanEntry] = []
+    renamed = process_targets(argv[1:], argv[0], options, service, plan)
+    try:
+        with open(plan_path + ".tmp", "w", encoding="utf-8") as f:
+            for entry in plan:
+                f.write(json.dumps(asdict(entry), ensure_ascii=False) + "\n")
+        os.replace(plan_path + ".tmp", plan_path)
+        # 以前の計画の実行記録は新しい計画には使えないため退避する
+        journal_path = get_journal_path(plan_path)
+        if os.path.exists(journal_path):
+            os.replace(journal_path, journal_path + ".old")
+            print(f"以前の実行記録を {journal_path}.old に移動しました。", file=sys.stderr)
+    except OSError as e:
+        print(f"リネーム計画を保存できませんでした: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{len(plan)} 件のリネーム計画を {plan_path} に保存しました。", file=sys.stderr)
+    if None in renamed and not options.force_rename:
+        sys.exit(1)
+
+def check_plan(plan: List[PlanEntry], pending: List[int], options: RenameOptions) -> List[str]:
+    """リネーム計画全体でリネーム先の重複・既存ファイルを確認し、問題の一覧を返す"""
+    def key(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    problems = []
+    dsts: Dict[str, int] = {}
+    srcs = {key(x.src): i for i, x in enumerate(plan)}
+    for i, entry in enumerate(plan):
+        dst = key(entry.dst)
+        if dst in dsts:
+            problems.append(f"{entry.dst} が {plan[dsts[dst]].src} と {entry.src} のリネーム先になっています。")
+        dsts.setdefault(dst, i)
+        if srcs.get(dst, i) != i:
+            problems.append(f"{entry.dst} は他のファイルのリネーム元です。")
+    for i in pending:
+        entry = plan[i]
+        if not os.path.exists(entry.src):
+            problems.append(f"{entry.src} がありません。")
+        elif key(entry.src) != key(entry.dst) and os.path.exists(entry.dst) and not options.force_rename:
+            problems.append(f"{entry.dst} はすでに存在しています。")
+    return problems
+
+def run_apply(plan_path: str, options: RenameOptions) -> None:
+    """-apply= オプション: リネーム計画を実行（中断した場合は続きから実行）"""
+    try:
+        plan = load_plan(plan_path)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"リネーム計画を読み込めません: {e}", file=sys.stderr)
+        sys.exit(1)
+    journal_path = get_journal_path(plan_path)
+    states, _ = PlanJournal.read(journal_path, plan)
+
+    # 移動の途中で中断したものは、移動が終わっていれば完了扱いにする
+    done = set()
+    for i, state in states.items():
+        if state == "done" or (state == "start" and not os.path.exists(plan[i].src) and os.path.exists(plan[i].dst)):
+            done.add(i)
+    pending = [i for i in range(len(plan)) if i not in done]
+    if done:
+        print(f"{len(done)} 件は前回実行済みのため、残り {len(pending)} 件を実行します。", file=sys.stderr)
+
+    problems = check_plan(plan, pending, options)
+    if problems:
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        print("リネーム計画に問題があるため実行しませんでした。", file=sys.stderr)
+        sys.exit(1)
+    if options.test_mode:
+        for i in pending:
+            print(plan[i].dst)
+        return
+
+    journal = PlanJournal(journal_path)
+    try:
+        # リネーム先のフォルダをまとめて作成（取り消し用に作成したフォルダを記録）
+        for folder in sorted({os.path.dirname(plan[i].dst) for i in pending}):
+            missing = []
+            parent = folder
+            while parent and not os.path.isdir(parent):
+                missing.append(parent)
+                parent = os.path.dirname(parent) if os.path.dirname(parent) != parent else ""
+            for path in reversed(missing):
+                journal.write(mkdir=path)
+                os.makedirs(path, exist_ok=True)
+
+        def apply(i: int) -> Optional[str]:
+            entry = plan[i]
+            journal.record(plan, i, "start")
+            try:
+                move_file(entry.src, entry.dst, options.sync_move)
+            except Exception as e:
+                return f"リネームエラー: {entry.src}: {e}"
+            journal.record(plan, i, "done")
+            return None
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        failed = 0
+        with ThreadPoolExecutor(max_workers=MOVE_WORKERS) as executor:
+            for i, error in zip(pending, executor.map(apply, pending)):
+                if error:
+                    print(error, file=sys.stderr)
+                    failed += 1
+                else:
+                    print(plan[i].dst)
+    except OSError as e:
+        print(f"リネーム計画を実行できませんでした: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        journal.close()
+    print(f"リネーム計画 {len(plan)} 件のうち {len(pending) - failed} 件をリネームしました。", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+def run_rollback(plan_path: str, options: RenameOptions) -> None:
+    """-rollback= オプション: 実行したリネーム計画を取り消す"""
+    try:
+        plan = load_plan(plan_path)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"リネーム計画を読み込めません: {e}", file=sys.stderr)
+        sys.exit(1)
+    journal_path = get_journal_path(plan_path)
+    states, dirs = PlanJournal.read(journal_path, plan)
+    if not states and not dirs:
+        print(f"{journal_path} がないため取り消すものがありません。", file=sys.stderr)
+        return
+
+    journal = PlanJournal(journal_path)
+    failed = 0
+    try:
+        for i in sorted(states, reverse=True):
+            entry = plan[i]
+            if states[i] not in ("start", "done") or os.path.exists(entry.src) or not os.path.exists(entry.dst):
+                continue
+            try:
+                os.makedirs(os.path.dirname(entry.src), exist_ok=True)
+                move_file(entry.dst, entry.src, options.sync_move)
+            except OSError as e:
+                print(f"取り消しエラー: {entry.dst}: {e}", file=sys.stderr)
+                failed += 1
+                continue
+            journal.record(plan, i, "undone")
+            print(entry.src)
+
+        # 作成したフォルダを空であれば削除
+        for path in reversed(dirs):
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+    finally:
+        journal.close()
+    if failed:
+        sys.exit(1)
+    os.unlink(journal_path)
+    print("リネーム計画の実行を取り消しました。", file=sys.stderr)
+
+def run_job(file_path: str, rename_format: str, options: RenameOptions) -> int:
+    """1ファイルをリネームして終了コードを返す"""
+    trace = new_trace(file_path, options)
+    with use_trace(trace):
+        try:
+            return run_traced_job(file_path, rename_format, options)
+        finally:
+            write_trace(trace, options.trace)
+
+def run_traced_job(file_path: str, rename_format: str, options: RenameOptions) -> int:
+    """run_job の本体（計測対象）"""
+    script_path = os.path.dirname(sys.argv[0])
+
+    with trace_stage("config"):
+        # SCRename.exc 読み込み
+        if is_excluded_file(script_path, file_path):
+            print(file_path)
+            print("対象外のファイルのため処理しませんでした。", file=sys.stderr)
+            trace_value("excluded", True)
+            return 1
+
+        # リネーム元ファイル存在確認
+        if not options.test_mode:
+            if not os.path.exists(file_path):
+                print(f"{file_path} がありません。", file=sys.stderr)
+                return 1
+
+        # SCRename.srv 読み込み
+        service = load_service_file(script_path)
+
+    if not process_file(file_path, rename_format, options, service):
+        if not options.force_rename:
+            return 1
+    return 0
+
+def get_socket_path() -> str:
+    """常駐モードのソケットのパスを取得"""
+    return os.path.join(os.path.abspath(os.path.dirname(sys.argv[0])), SOCKET_FILE)
+
+class JobHandler:
+    """常駐モードで1件のリネーム要求を処理（socketserver.StreamRequestHandler と組み合わせて使う）"""
+
+    def handle(self) -> None:
+        try:
+            job = json.loads(self.rfile.readline().decode("utf-8"))
+            names = {x.name for x in fields(RenameOptions)}
+            options = RenameOptions(**{k: v for k, v in job.get("options", {}).items() if k in names})
+            file_path = job["file"]
+            rename_format = job["format"]
+        except (ValueError, KeyError, TypeError) as e:
+            self.reply(1, "", f"不正な要求です: {e}\n")
+            return
+
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with sys.stdout.capture(stdout), sys.stderr.capture(stderr):
+            try:
+                code = run_job(file_path, rename_format, options)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except Exception as e:
+                print(f"リネーム中にエラーが発生しました: {e}", file=sys.stderr)
+                code = 1
+        sys.stderr.write(f"{file_path} -> {code}\n")
+        self.reply(code, stdout.getvalue(), stderr.getvalue())
+
+    def reply(self, code: int, stdout: str, stderr: str) -> None:
+        self.wfile.write(json.dumps({"code": code, "stdout": stdout, "stderr": stderr}, ensure_ascii=False).encode("utf-8") + b"\n")
+
+def run_daemon() -> None:
+    """-d オプション: 設定と接続を保持したまま常駐してリネーム要求を待ち受ける"""
+    import signal
+    import socket
+    import socketserver
+
+    if not hasattr(socket, "AF_UNIX"):
+        print("この環境では常駐モードを使用できません。", file=sys.stderr)
+        sys.exit(1)
+    socket_path = get_socket_path()
+    if os.path.exists(socket_path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(socket_path)
+            print(f"{socket_path} ですでに常駐しています。", file=sys.stderr)
+            sys.exit(1)
+        except OSError:
+            os.unlink(socket_path)
+
+    # 設定ファイルとキャッシュを先に読み込んでおく
+    script_path = os.path.dirname(sys.argv[0])
+    load_service_file(script_path)
+    load_exclusions(script_path)
+    get_response_cache()
+    get_tid_store()
+
+    # ジョブごとに出力を切り替えられるようにする
+    sys.stdout = ThreadOutput(sys.stdout)
+    sys.stderr = ThreadOutput(sys.stderr)
+    class Handler(JobHandler, socketserver.StreamRequestHandler):
+        pass
+
+    server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+    server.daemon_threads = True
+    print(f"{socket_path} で待ち受けています。", file=sys.stderr)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+def run_client(file_path: str, rename_format: str, options: RenameOptions) -> int:
+    """-c オプション: 常駐しているプロセスにリネームを依頼（常駐していなければ自身で処理）"""
+    import socket
+
+    if hasattr(socket, "AF_UNIX"):
+        job = {"file": os.path.abspath(file_path), "format": rename_format, "options": asdict(options)}
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            try:
+                sock.connect(get_socket_path())
+            except OSError:
+                sock.close()
+                return run_job(file_path, rename_format, options)
+            # 依頼を送った後は常駐プロセスがリネームした可能性があるため、自身では処理しない
+            try:
+                sock.sendall(json.dumps(job, ensure_ascii=False).encode("utf-8") + b"\n")
+                with sock.makefile("rb") as f:
+                    result = json.loads(f.readline().decode("utf-8"))
+                stderr, stdout, code = result["stderr"], result["stdout"], result["code"]
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"常駐しているプロセスから結果を受け取れませんでした: {e}", file=sys.stderr)
+                return 1
+        finally:
+            sock.close()
+        sys.stderr.write(stderr)
+        sys.stdout.write(stdout)
+        return code
+    return run_job(file_path, rename_format, options)
+
+class Inotify:
+    """inotify によるフォルダ監視（Linuxのみ）"""
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+
+    def __init__(self) -> None:
+        import ctypes
+        import ctypes.util
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify を使用できません")
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.watches: Dict[int, str] = {}
+
+    def add_watch(self, path: str, mask: int) -> None:
+        """フォルダを監視対象に追加"""
+        import ctypes
+
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()), path)
+        self.watches[wd] = path
+
+    def read(self) -> List[Tuple[str, int]]:
+        """届いているイベントを (パス, マスク) のリストで取得"""
+        import struct
+
+        event = struct.Struct("iIII")
+        events = []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return events
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = event.unpack_from(data, offset)
+            offset += event.size
+            name = os.fsdecode(data[offset:offset + length].split(b"\0", 1)[0])
+            offset += length
+            events.append((os.path.join(self.watches.get(wd, ""), name), mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+def run_watch(argv: List[str], options: RenameOptions) -> None:
+    """-w オプション: フォルダを監視し、書き込みが完了したファイルをリネーム"""
+    import select
+
+    if len(argv) < 2:
+        print("パラメータが足りません。", file=sys.stderr)
+        sys.exit(1)
+    rename_format = argv[0]
+    script_path = os.path.dirname(sys.argv[0])
+    try:
+        inotify = Inotify()
+        for path in argv[1:]:
+            inotify.add_watch(os.path.abspath(path), Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO)
+    except OSError as e:
+        print(f"フォルダを監視できません: {e}", file=sys.stderr)
+        sys.exit(1)
+    sys.stdout.reconfigure(line_buffering=True)
+    print(f"{'、'.join(argv[1:])} を監視しています。", file=sys.stderr)
+
+    pending: Dict[str, float] = {}  # 書き込み完了を待っているファイル → 最後のイベント時刻
+    produced = set()                # リネーム後のファイル（自身の移動によるイベントを無視する）
+    wake_at = None
+    try:
+        while True:
+            timeout = None if wake_at is None else max(0, wake_at - time.monotonic())
+            readable, _, _ = select.select([inotify.fd], [], [], timeout)
+            if readable:
+                for path, mask in inotify.read():
+                    if mask & Inotify.IN_Q_OVERFLOW:
+                        print("イベントが多すぎるため一部を取りこぼしました。", file=sys.stderr)
+                    elif mask & Inotify.IN_ISDIR:
+                        continue
+                    elif path in produced:
+                        produced.discard(path)
+                    elif os.path.splitext(path)[1].lower() in WATCH_EXTENSIONS and not is_excluded_file(script_path, path):
+                        pending[path] = time.monotonic()
+                        # 同時に終わった録画をまとめて処理するため、イベントが途切れるまで待つ
+                        wake_at = time.monotonic() + WATCH_DEBOUNCE
+                continue
+
+            # 一定時間更新されていないファイルを書き込み完了とみなす
+            ready = []
+            wake_at = None
+            now = time.time()
+            for path in list(pending):
+                try:
+                    age = now - os.stat(path).st_mtime
+                except OSError:
+                    del pending[path]
+                    continue
+                if age >= WATCH_QUIET:
+                    ready.append(path)
+                    del pending[path]
+                else:
+                    retry_at = time.monotonic() + WATCH_QUIET - age
+                    wake_at = retry_at if wake_at is None else min(wake_at, retry_at)
+            if ready:
+                service = load_service_file(script_path)
+                # イベントが届くのは監視中のフォルダに移動した場合だけなので、それ以外は記録しない
+                watched = set(inotify.watches.values())
+                for dst_path in process_files(sorted(ready), rename_format, options, service):
+                    if dst_path and not options.test_mode and os.path.dirname(os.path.abspath(dst_path)) in watched:
+                        produced.add(os.path.abspath(dst_path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        inotify.close()
 
 def main():
     # 変数初期化
     options = RenameOptions()
+    batch_mode = False
+    daemon_mode = False
+    client_mode = False
+    watch_mode = False
+    prefetch_mode = False
+    retry_mode = False
+    sync_mode = False
+    plan_path = None
+    apply_path = None
+    rollback_path = None
     argv = []
     argc = 0
     elen = 0
@@ -1214,8 +3588,40 @@ def main():
     for arg in sys.argv[1:]:
         if arg.lower() in ["-h", "-?"]:
             print("\nSCRename.py [オプション] \"ファイル\" \"リネーム書式\"")
-            print("              [タイトル開始位置] [検索文字数]\n")
+            print("              [タイトル開始位置] [検索文字数]")
+            print("SCRename.py -b [オプション] \"リネーム書式\" \"ファイル・フォルダ\" ...")
+            print("SCRename.py -w [オプション] \"リネーム書式\" \"フォルダ\" ...")
+            print("SCRename.py -p [オプション] \"予約リスト\"")
+            print("SCRename.py -r")
+            print("SCRename.py -u")
+            print("SCRename.py -plan=\"計画ファイル\" [オプション] \"リネーム書式\" \"ファイル\" ...")
+            print("SCRename.py -apply=\"計画ファイル\" [オプション]")
+            print("SCRename.py -rollback=\"計画ファイル\"")
+            print("SCRename.py -d")
+            print("SCRename.py -c [オプション] \"ファイル\" \"リネーム書式\" [タイトル開始位置] [検索文字数]\n")
             sys.exit(1)
+        elif arg.lower() == "-b":
+            batch_mode = True
+        elif arg.lower() == "-d":
+            daemon_mode = True
+        elif arg.lower() == "-c":
+            client_mode = True
+        elif arg.lower() == "-w":
+            watch_mode = True
+        elif arg.lower() == "-p":
+            prefetch_mode = True
+        elif arg.lower() == "-r":
+            retry_mode = True
+        elif arg.lower() == "-u":
+            sync_mode = True
+        elif arg.lower().startswith("-plan="):
+            plan_path = os.path.abspath(arg[6:])
+        elif arg.lower().startswith("-apply="):
+            apply_path = os.path.abspath(arg[7:])
+        elif arg.lower().startswith("-rollback="):
+            rollback_path = os.path.abspath(arg[10:])
+        elif arg.lower() == "-o":
+            set_offline()
         elif arg.lower() == "-t":
             options.test_mode = True
         elif arg.lower() == "-n":
@@ -1228,55 +3634,61 @@ def main():
             options.search_episode = True
         elif arg.lower() == "-a1":
             options.recursive_search = True
+        elif arg.lower() == "-y":
+            options.sync_move = True
+        elif arg.lower() == "-j":
+            options.trace = "-"
+        elif arg.lower().startswith("-j="):
+            options.trace = os.path.abspath(arg[3:])
         else:
             argv.append(arg)
             argc += 1
 
     # 起動時処理
     print("\nSCRename 動作中...\n", file=sys.stderr)
+    if daemon_mode:
+        run_daemon()
+        return
+    if batch_mode:
+        run_batch(argv, options)
+        return
+    if watch_mode:
+        run_watch(argv, options)
+        return
+    if prefetch_mode:
+        run_prefetch(argv, options)
+        return
+    if sync_mode:
+        run_title_sync()
+        return
+    if plan_path:
+        run_plan(argv, plan_path, options)
+        return
+    if apply_path:
+        run_apply(apply_path, options)
+        return
+    if rollback_path:
+        run_rollback(rollback_path, options)
+        return
+    if retry_mode:
+        run_retry()
+        return
+
     if argc < 2:
         print(argv[0] if argv else "")
         print("パラメータが足りません。", file=sys.stderr)
-        time.sleep(1)
         sys.exit(1)
     elif not argv[0]:
         print("処理対象のファイルが指定されていません。", file=sys.stderr)
-        time.sleep(1)
         sys.exit(1)
     elif not argv[1]:
         print(argv[0])
         print("リネーム書式が指定されていません。", file=sys.stderr)
-        time.sleep(1)
         sys.exit(1)
 
     # 実体名最大文字数取得
     elen = max(len(x) for x in CHAR9) + 2
 
-    # スクリプトのパスを取得
-    script_path = os.path.dirname(sys.argv[0])
-
-    # SCRename.exc 読み込み
-    exc_path = os.path.join(script_path, "SCRename.exc")
-    if os.path.exists(exc_path):
-        with open(exc_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith(":"):
-                    if line.upper() in argv[0].upper():
-                        print(argv[0])
-                        print("対象外のファイルのため処理しませんでした。", file=sys.stderr)
-                        sys.exit(1)
-
-    # リネーム元ファイル存在確認
-    if not options.test_mode:
-        if not os.path.exists(argv[0]):
-            print(f"{argv[0]} がありません。", file=sys.stderr)
-            time.sleep(1)
-            sys.exit(1)
-
-    # SCRename.srv 読み込み
-    service = load_service_file(script_path)
-
     # 検索文字数の取得
     if argc > 3 and argv[3].isdigit():
         options.search_len = int(argv[3])
@@ -1285,9 +3697,12 @@ def main():
     if argc > 2 and argv[2].isdigit():
         options.start_pos = int(argv[2])
 
-    if not process_file(argv[0], argv[1], options, service):
-        if not options.force_rename:
-            sys.exit(1)
+    if client_mode:
+        code = run_client(argv[0], argv[1], options)
+    else:
+        code = run_job(argv[0], argv[1], options)
+    if code:
+        sys.exit(code)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
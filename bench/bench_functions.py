@@ -0,0 +1,150 @@
+"""ファイル名解析・番組表検索・書式置換の関数ごとのベンチマーク
+
+合成した EpgDataCap_Bon 形式のファイル名と rss2.php を入力に、各関数の
+1秒あたりの処理件数と、1回の呼び出しで一時的に確保するメモリの最大値・
+呼び出し後も残るメモリ（tracemalloc）を計測する。
+--save で結果を基準値（bench/baseline.json）として保存し、--check で基準値と比較して
+処理件数が許容範囲を超えて落ちた関数があれば終了コード 1 を返す。
+
+    python bench/bench_functions.py [--save] [--check] [--tolerance 割合] [--repeat 回数] [関数名 ...]
+"""
+import argparse
+import contextlib
+import datetime
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import SCRename
+from corpus import generate_feed, generate_filenames, generate_queries
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+FILE_COUNT = 2000            # ファイル名の件数
+FEED_SIZES = (50, 500, 2000)  # 番組表の1日あたりの番組数
+FEED_DAYS = 8
+QUERY_COUNT = 20
+DATE_FORMAT = "$SCyear2$\\$SCmonth$\\$SCdate2$_$SCtime$-$SCedtime$ $SCweek$ $SCquarter$Q $SCtitle$"
+
+def build_cases() -> Dict[str, Tuple[Callable, List[tuple]]]:
+    """ベンチマーク名 → (関数, 引数の一覧)"""
+    service = SCRename.load_service_file(os.path.dirname(os.path.abspath(SCRename.__file__)))
+    filenames = generate_filenames(FILE_COUNT)
+
+    # 各段階の入力は実際の処理順に前段の出力から作る
+    dates, raw_titles, normalized, titles = [], [], [], []
+    for filename in filenames:
+        date = SCRename.get_date_from_title(filename, 0)
+        raw_title = filename[date[3]:] if date[3] > 1 else filename
+        dates.append(date)
+        raw_titles.append(raw_title)
+        normalized.append(SCRename.convert_chars(SCRename.remove_leading_chars(raw_title)))
+        titles.append(SCRename.get_title(normalized[-1]))
+
+    cases = {
+        "get_date_from_title": (SCRename.get_date_from_title, [(x, 0) for x in filenames]),
+        "remove_leading_chars": (SCRename.remove_leading_chars, [(x,) for x in raw_titles]),
+        "convert_chars": (SCRename.convert_chars, [(SCRename.remove_leading_chars(x),) for x in raw_titles]),
+        "get_title": (SCRename.get_title, [(x, 4) for x in normalized]),
+        "get_service": (SCRename.get_service, [(x, t, service, 0) for x, t in zip(normalized, titles)]),
+    }
+
+    start = datetime.datetime(2023, 4, 1)
+    queries = generate_queries(start, FEED_DAYS, QUERY_COUNT)
+    for per_day in FEED_SIZES:
+        feed = generate_feed(start, FEED_DAYS, per_day).encode("utf-8")
+        args = [(feed, title, serv if serv < len(service) else -1, service, tgtdt, dtflag)
+                for title, serv, tgtdt, dtflag in queries]
+        cases[f"search_program_info[{per_day}/日]"] = (SCRename.search_program_info, args)
+
+    numbers = ["#1", "#12", "#1-2", "#3#4", "#100", "#5.5", "第1話", "#01「前編」"]
+    cases["process_episode_number"] = (SCRename.process_episode_number, [(numbers[i % len(numbers)],) for i in range(FILE_COUNT)])
+    cases["replace_date_time_macros"] = (SCRename.replace_date_time_macros, [(DATE_FORMAT, x[0], "") for x in dates])
+    spaced = [f"  {t} \\ {x[:10]}  　第１話  「{x[10:20]}」 \\ {x[20:]}  " for t, x in zip(titles, normalized)]
+    cases["remove_unnecessary_spaces"] = (SCRename.remove_unnecessary_spaces, [(x,) for x in spaced])
+    return cases
+
+def measure(func: Callable, args: List[tuple], repeat: int) -> Dict[str, float]:
+    """1秒あたりの処理件数（repeat 回の最良値）と確保したメモリを計測"""
+    best = float("inf")
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t = time.perf_counter()
+            for a in args:
+                func(*a)
+            best = min(best, time.perf_counter() - t)
+    finally:
+        gc.enable()
+
+    # 戻り値は捨てるので、走査中のピークは1回の呼び出しで確保するメモリの最大値になる
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        for a in args:
+            func(*a)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"ops_per_sec": len(args) / best, "peak_bytes": peak - base, "retained_bytes": max(0, current - base)}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="関数ごとのベンチマーク")
+    parser.add_argument("names", nargs="*", help="計測する関数名（前方一致、省略時はすべて）")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数")
+    parser.add_argument("--save", action="store_true", help="結果を基準値として保存")
+    parser.add_argument("--check", action="store_true", help="基準値と比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="許容する処理件数の低下割合")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    # 関数が出力するメッセージは捨てる
+    devnull = open(os.devnull, "w", encoding="utf-8")
+    with contextlib.redirect_stderr(devnull):
+        cases = build_cases()
+    results = {}
+    regressions = []
+    for name, (func, case_args) in cases.items():
+        if args.names and not any(name.startswith(x) for x in args.names):
+            continue
+        with contextlib.redirect_stderr(devnull):
+            result = measure(func, case_args, args.repeat)
+        results[name] = result
+
+        line = (f"{name:<30} {result['ops_per_sec']:11,.0f} 件/秒  "
+                f"一時 {result['peak_bytes']:11,.0f} B  残存 {result['retained_bytes']:9,.0f} B")
+        base = baseline.get(name)
+        if base:
+            ratio = result["ops_per_sec"] / base["ops_per_sec"]
+            line += f"  基準比 {ratio:6.2f}"
+            if ratio < 1 - args.tolerance:
+                regressions.append(name)
+                line += "  *低下*"
+        print(line)
+
+    if args.save:
+        baseline.update({k: {x: round(y, 1) for x, y in v.items()} for k, v in results.items()})
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"{BASELINE_FILE} に保存しました。")
+    if args.check:
+        if not baseline:
+            print("基準値がありません。--save で作成してください。", file=sys.stderr)
+            sys.exit(1)
+        if regressions:
+            print(f"基準値より {args.tolerance:.0%} 以上遅くなった関数: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""番組表検索のベンチマーク
+
+8日分・数千件の合成 rss2.php で、ファイルごとに番組表を走査する場合と
+解析済みの ProgramSchedule を共有する場合の検索コストを比較する。
+
+    python bench/bench_schedule.py [1日あたりの番組数] [検索回数]
+"""
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import SCRename
+from corpus import generate_feed, generate_queries
+
+DAYS = 8
+
+def main() -> None:
+    per_day = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    start = datetime.datetime(2023, 4, 1)
+    feed = generate_feed(start, DAYS, per_day).encode("utf-8")
+    queries = generate_queries(start, DAYS, count)
+    service = SCRename.load_service_file(os.path.dirname(os.path.abspath(SCRename.__file__)))
+
+    def run(search) -> float:
+        t = time.perf_counter()
+        for title, serv, tgtdt, dtflag in queries:
+            search(title, serv if serv < len(service) else -1, tgtdt, dtflag)
+        return (time.perf_counter() - t) / len(queries)
+
+    t = time.perf_counter()
+    schedule = SCRename.ProgramSchedule.parse(feed)
+    parse_time = time.perf_counter() - t
+
+    per_file = run(lambda *q: SCRename.search_program_info(feed, q[0], q[1], service, q[2], q[3]))
+    cold = run(lambda *q: SCRename.search_schedule(SCRename.ProgramSchedule(schedule.entries), q[0], q[1], service, q[2], q[3]))
+    warm = run(lambda *q: SCRename.search_schedule(schedule, q[0], q[1], service, q[2], q[3]))
+
+    print(f"番組表: {DAYS}日 / {len(schedule.entries)}件 / {len(feed) // 1024} KB")
+    print(f"解析（1回）               : {parse_time * 1000:8.2f} ms")
+    print(f"ファイルごとに解析して検索: {per_file * 1000:8.3f} ms/件")
+    print(f"共有番組表（索引作成込み）: {cold * 1000:8.3f} ms/件")
+    print(f"共有番組表（索引作成済み）: {warm * 1000:8.3f} ms/件")
+
+if __name__ == "__main__":
+    main()
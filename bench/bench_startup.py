@@ -0,0 +1,97 @@
+"""起動時間のベンチマーク
+
+1ファイルごとに起動される使い方を想定し、次の2つについて
+最初の出力までの時間と終了までの時間、import にかかった時間（-X importtime）を計測する。
+
+- 対象外（SCRename.exc に該当）のファイル
+- 番組表がキャッシュに入っているファイルのリネーム（-t で実際には移動しない）
+
+スクリプトと設定ファイルを一時フォルダにコピーして実行するため、通信もリポジトリ内の SCRename.db も使わない。
+
+    python bench/bench_startup.py [回数]
+"""
+import datetime
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import corpus
+
+CONFIG_FILES = ["SCRename.srv", "SCRename.rp1", "SCRename.rp2", "SCRename.tid"]
+TARGET_DATE = datetime.datetime(2023, 4, 1, 12, 30)
+TARGET_FILE = f"{TARGET_DATE:%Y%m%d%H%M}_ゆるキャン△ _テレビ東京.ts"
+EXCLUDED_FILE = f"{TARGET_DATE:%Y%m%d%H%M}_ゆるキャン△ _テレビ東京.ts.EXCLUDED.ts"
+RENAME_FORMAT = "$SCtitle$ #$SCnumber$ $SCsubtitle$ ($SCservice$)"
+
+def prepare(workdir: str) -> str:
+    """一時フォルダにスクリプト・設定ファイル・キャッシュを用意"""
+    script = os.path.join(workdir, "SCRename.py")
+    shutil.copy(os.path.join(ROOT, "SCRename.py"), script)
+    for name in CONFIG_FILES:
+        shutil.copy(os.path.join(ROOT, name), workdir)
+    with open(os.path.join(workdir, "SCRename.exc"), "w", encoding="utf-8") as f:
+        f.write(":リネーム対象外定義ファイル\n.EXCLUDED.\n")
+
+    # 検索対象の番組を含む番組表をキャッシュに入れておく
+    code = (
+        "import sys, datetime, SCRename\n"
+        "sys.argv[0] = sys.argv[1]\n"
+        "tgtdt = datetime.datetime.fromisoformat(sys.argv[2])\n"
+        "start, days = SCRename.get_search_window(tgtdt, 1)\n"
+        "slices = SCRename.split_feed_days(sys.stdin.buffer.read(), start, days)\n"
+        "SCRename.get_response_cache().put_feed_days(slices, min_ttl=86400)\n"
+    )
+    start = TARGET_DATE.replace(hour=0, minute=0) - datetime.timedelta(days=1)
+    item = (f"<item><title>ゆるキャン△|テレビ東京|{TARGET_DATE + datetime.timedelta(minutes=30):%H:%M}|#12「はじまり」</title>"
+            f"<link>http://cal.syoboi.jp/tid/1</link><pubDate>{TARGET_DATE:%Y-%m-%dT%H:%M:%S}+09:00</pubDate></item>\n")
+    feed = corpus.generate_feed(start, 2, 200).replace("</channel>", item + "</channel>")
+    subprocess.run([sys.executable, "-c", code, script, TARGET_DATE.isoformat()],
+                   input=feed.encode("utf-8"), cwd=workdir, check=True,
+                   env=dict(os.environ, PYTHONPATH=workdir, PYTHONIOENCODING="utf-8"))
+    return script
+
+def run_once(script: str, args: list):
+    """1回起動し、(最初の出力までの秒数, 終了までの秒数, import の秒数, 出力) を返す"""
+    env = dict(os.environ, PYTHONIOENCODING="utf-8", http_proxy="http://127.0.0.1:9", no_proxy="")
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-X", "importtime", script] + args,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, cwd=os.path.dirname(script))
+    first = proc.stdout.readline()
+    first_output = time.perf_counter() - start
+    rest, err = proc.communicate()
+    total = time.perf_counter() - start
+
+    # importtime の出力からトップレベルの import の累積時間を合計
+    imports = 0
+    for line in err.decode("utf-8", "replace").splitlines():
+        if line.startswith("import time:") and "|" in line:
+            parts = line.split("|")
+            if parts[1].strip().isdigit() and not parts[2].startswith("  "):
+                imports += int(parts[1])
+    return first_output, total, imports / 1e6, (first + rest).decode("utf-8", "replace").strip()
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with tempfile.TemporaryDirectory() as workdir:
+        script = prepare(workdir)
+        cases = {
+            "対象外のファイル": ["-t", os.path.join(workdir, EXCLUDED_FILE), RENAME_FORMAT],
+            "キャッシュから検索": ["-t", os.path.join(workdir, TARGET_FILE), RENAME_FORMAT],
+        }
+        for label, args in cases.items():
+            results = [run_once(script, args) for _ in range(count)]
+            print(f"{label}: 出力 {results[0][3].splitlines()[-1] if results[0][3] else '(なし)'}")
+            for name, index in (("最初の出力まで", 0), ("終了まで", 1), ("import", 2)):
+                values = [x[index] * 1000 for x in results]
+                print(f"  {name:<8} 中央値 {statistics.median(values):7.1f} ms  最小 {min(values):7.1f} ms")
+
+if __name__ == "__main__":
+    main()
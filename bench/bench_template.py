@@ -0,0 +1,62 @@
+"""リネーム書式の置換のベンチマーク
+
+従来の str.replace の連鎖（話数・開始日時・終了日時・番組情報）と、
+書式を一度だけ解析した RenameTemplate による置換の速度を比較する。
+
+    python bench/bench_template.py [件数]
+"""
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SCRename
+
+FORMATS = {
+    "標準": "$SCtitle$ $SCpart$第$SCnumber$話 「$SCsubtitle$」 ($SCservice$)",
+    "日時付き": "$SCyear2s$\\$SCmonths$\\$SCtitle$\\$SCdate2s$_$SCtimes$-$SCedtime$_$SCtitle$ #$SCnumber3$ $SCsubtitle$ [$SCweek$]",
+}
+
+def replace_chain(rename_format: str, values: SCRename.RenameValues) -> str:
+    """従来の置換処理"""
+    dst_path = rename_format
+    number1, number2, number3, number4 = SCRename.process_episode_number(values.number)
+    dst_path = dst_path.replace("$SCnumber1$", number1)
+    dst_path = dst_path.replace("$SCnumber$", number2)
+    dst_path = dst_path.replace("$SCnumber2$", number2)
+    dst_path = dst_path.replace("$SCnumber3$", number3)
+    dst_path = dst_path.replace("$SCnumber4$", number4)
+    dst_path = SCRename.replace_date_time_macros(dst_path, values.stdt, "")
+    dst_path = SCRename.replace_date_time_macros(dst_path, values.eddt, "ed")
+    return SCRename.replace_program_info_macros(dst_path, values.main_title, values.subtitle, values.service_name)
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    start = datetime.datetime(2023, 4, 1)
+    samples = []
+    for i in range(count):
+        stdt = start + datetime.timedelta(minutes=37 * i)
+        samples.append(SCRename.RenameValues(stdt, stdt + datetime.timedelta(minutes=30), f"#{i % 26 + 1}",
+                                             f"番組タイトル{i % 50}", f"サブタイトル{i}", "TX"))
+
+    for label, rename_format in FORMATS.items():
+        for values in samples[:100]:
+            assert replace_chain(rename_format, values) == SCRename.compile_rename_format(rename_format).render(values)
+
+        t = time.perf_counter()
+        for values in samples:
+            replace_chain(rename_format, values)
+        chain = (time.perf_counter() - t) / count
+
+        t = time.perf_counter()
+        template = SCRename.compile_rename_format(rename_format)
+        for values in samples:
+            template.render(values)
+        compiled = (time.perf_counter() - t) / count
+
+        print(f"{label}: 従来 {chain * 1e6:7.1f} us/件  解析済み書式 {compiled * 1e6:7.1f} us/件  ({chain / compiled:.1f}倍)")
+
+if __name__ == "__main__":
+    main()
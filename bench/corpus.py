@@ -0,0 +1,83 @@
+"""ベンチマーク用の合成データ生成"""
+import datetime
+import html
+import random
+from typing import List, Tuple
+
+TITLES = [
+    "けいおん！", "侵略！イカ娘", "魔法少女まどか☆マギカ", "STEINS;GATE", "とある科学の超電磁砲",
+    "ソードアート・オンライン", "進撃の巨人", "ご注文はうさぎですか？", "ゆるキャン△", "ぼっち・ざ・ろっく！",
+    "葬送のフリーレン", "薬屋のひとりごと", "響け！ユーフォニアム", "宇宙よりも遠い場所", "リコリス・リコイル",
+    "SPY×FAMILY", "チェンソーマン", "呪術廻戦", "鬼滅の刃", "ONE PIECE",
+]
+CHANNELS = [
+    ("TOKYO MX", "MX"), ("テレビ東京", "TX"), ("TBS", "TBS"), ("フジテレビ", "CX"), ("日本テレビ", "NTV"),
+    ("テレビ朝日", "EX"), ("BS11イレブン", "BS11"), ("AT-X", "AT-X"), ("NHK総合", "NHK-G"), ("BSフジ", "BS-FUJI"),
+]
+SUBTITLES = ["はじまり", "つづき &amp; その後", "&quot;約束&quot;", "A&lt;B&gt;C", "最終回"]
+# EpgDataCap_Bon の録画ファイル名で番組名の前後に付く装飾
+DECORATIONS = [
+    ("", ""), ("", ""), ("", ""), ("[新]", ""), ("【新】", "[字]"), ("", "[字][デ]"), ("", "[再]"),
+    ("", "【終】"), ("", "（第２期）"), ("", "Ⅱ"), ("＜アニメギルド＞", ""), ("アニメ「", "」"), ("『", "』"),
+]
+
+def generate_programs(start: datetime.datetime, days: int, per_day: int, seed: int = 1) -> List[Tuple[str, str, datetime.datetime, int, str]]:
+    """番組一覧（タイトル, 放送局, 開始日時, 分, 話数・サブタイトル）を生成"""
+    rnd = random.Random(seed)
+    programs = []
+    for n in range(days * per_day):
+        title = rnd.choice(TITLES)
+        if rnd.random() < 0.5:
+            title = f"{title} 第{rnd.randint(2, 4)}期 {n % 97}"
+        st = start + datetime.timedelta(minutes=rnd.randrange(days * 24 * 12) * 5)
+        minutes = rnd.choice([15, 30, 30, 30, 60])
+        if rnd.random() < 0.8:
+            sub = f"#{rnd.randint(1, 26)}「{rnd.choice(SUBTITLES)}」"
+        else:
+            sub = f"#{rnd.randint(1, 26)}"
+        programs.append((title, rnd.choice(CHANNELS)[0], st, minutes, sub))
+    programs.sort(key=lambda x: x[2])
+    return programs
+
+def generate_feed(start: datetime.datetime, days: int, per_day: int = 500, seed: int = 1) -> str:
+    """rss2.php 形式の番組表を生成"""
+    out = ['<?xml version="1.0" encoding="UTF-8"?>',
+           '<rss version="2.0"><channel><title>しょぼいカレンダー</title><link>http://cal.syoboi.jp/</link>']
+    for title, channel, st, minutes, sub in generate_programs(start, days, per_day, seed):
+        ed = st + datetime.timedelta(minutes=minutes)
+        out.append(f"<item><title>{title}|{channel}|{ed:%H:%M}|{sub}</title>"
+                   f"<link>http://cal.syoboi.jp/tid/1</link>"
+                   f"<pubDate>{st:%Y-%m-%dT%H:%M:%S}+09:00</pubDate></item>")
+    out.append("</channel></rss>")
+    return "\n".join(out)
+
+def generate_queries(start: datetime.datetime, days: int, count: int, seed: int = 2) -> List[Tuple[str, int, datetime.datetime, int]]:
+    """検索条件（タイトル, 放送局番号, 基準日時, dtflag）を生成"""
+    rnd = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        title = rnd.choice(TITLES)[:4]
+        tgtdt = start + datetime.timedelta(minutes=rnd.randrange(days * 24 * 60))
+        queries.append((title, rnd.randrange(-1, 10), tgtdt, rnd.choice([0, 1])))
+    return queries
+
+def generate_filenames(count: int, seed: int = 3) -> List[str]:
+    """EpgDataCap_Bon 形式（日付時刻_番組名_放送局）の録画ファイル名を生成"""
+    rnd = random.Random(seed)
+    start = datetime.datetime(2023, 4, 1)
+    names = []
+    for _ in range(count):
+        st = start + datetime.timedelta(minutes=rnd.randrange(365 * 24 * 12) * 5)
+        prefix, suffix = rnd.choice(DECORATIONS)
+        title = f"{prefix}{rnd.choice(TITLES)}{suffix}"
+        if rnd.random() < 0.5:
+            subtitle = html.unescape(rnd.choice(SUBTITLES))
+            title = f"{title} #{rnd.randint(1, 26)}「{subtitle}」"
+        else:
+            title = f"{title}　第{chr(0xFF10 + rnd.randint(1, 9))}話"
+        channel = rnd.choice(CHANNELS)[0]
+        if rnd.random() < 0.8:
+            names.append(f"{st:%Y%m%d%H%M}_{title}_{channel}")
+        else:
+            names.append(f"{title}_{channel}_{st:%Y%m%d%H%M}")
+    return names
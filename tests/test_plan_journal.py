@@ -0,0 +1,51 @@
+"""リネーム計画の実行記録が別の計画に使われないことを確認する"""
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import SCRename
+
+def write_plan(plan_path: str, pairs) -> None:
+    """（リネーム元, リネーム先）の組からリネーム計画を作成"""
+    with open(plan_path, "w", encoding="utf-8") as f:
+        for src, dst in pairs:
+            entry = SCRename.PlanEntry(src, dst, "番組", None, None, None, None)
+            f.write(json.dumps(SCRename.asdict(entry), ensure_ascii=False) + "\n")
+
+def make_files(folder: str, names) -> list:
+    paths = []
+    for name in names:
+        path = os.path.join(folder, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(name)
+        paths.append(path)
+    return paths
+
+def test_old_journal_is_ignored_for_new_plan(tmp_path):
+    plan_path = str(tmp_path / "plan.jsonl")
+    out = tmp_path / "out"
+    srcs = make_files(str(tmp_path), ["a.ts", "b.ts"])
+    write_plan(plan_path, [(x, str(out / ("1" + os.path.basename(x)))) for x in srcs])
+    SCRename.run_apply(plan_path, SCRename.RenameOptions())
+    assert sorted(os.listdir(out)) == ["1a.ts", "1b.ts"]
+
+    # 同じパスに別のファイルの計画を作り直しても、前回の記録で実行済みにならない
+    srcs = make_files(str(tmp_path), ["c.ts", "d.ts"])
+    write_plan(plan_path, [(x, str(out / ("2" + os.path.basename(x)))) for x in srcs])
+    SCRename.run_apply(plan_path, SCRename.RenameOptions())
+    assert sorted(os.listdir(out)) == ["1a.ts", "1b.ts", "2c.ts", "2d.ts"]
+
+def test_journal_index_past_plan_end(tmp_path):
+    plan_path = str(tmp_path / "plan.jsonl")
+    srcs = make_files(str(tmp_path), ["a.ts"])
+    dst = str(tmp_path / "out" / "a.ts")
+    write_plan(plan_path, [(srcs[0], dst)])
+    with open(SCRename.get_journal_path(plan_path), "w", encoding="utf-8") as f:
+        f.write(json.dumps({"index": 5, "state": "done", "src": srcs[0], "dst": dst}) + "\n")
+    SCRename.run_apply(plan_path, SCRename.RenameOptions())
+    assert os.path.exists(dst)
+    SCRename.run_rollback(plan_path, SCRename.RenameOptions())
+    assert os.path.exists(srcs[0]) and not os.path.exists(dst)
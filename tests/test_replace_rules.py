@@ -0,0 +1,62 @@
+"""SCRename.rp1 / SCRename.rp2 の置換が定義を1行ずつ str.replace する従来の処理と一致するか確認する"""
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import SCRename
+
+def replace_sequentially(path: str, text: str) -> str:
+    """従来の処理: 定義ファイルの順に1行ずつ置換"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith(":"):
+                parts = line.split(",", 1)
+                if len(parts) == 2:
+                    text = text.replace(parts[0], parts[1])
+    return text
+
+def random_inputs(path: str, count: int):
+    """定義に含まれる文字列・文字を組み合わせた入力を生成"""
+    pieces = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith(":"):
+                pieces.extend(x for x in line.split(",", 1) if x)
+    chars = sorted(set("".join(pieces))) + list(" 　#1「」")
+    rnd = random.Random(0)
+    for _ in range(count):
+        parts = []
+        for _ in range(rnd.randint(1, 6)):
+            piece = rnd.choice(pieces)
+            if rnd.random() < 0.5:
+                # 定義の一部だけを使い、部分的に一致する入力も作る
+                i = rnd.randint(0, len(piece))
+                piece = piece[:i] if rnd.random() < 0.5 else piece[i:]
+            parts.append(piece)
+            parts.append("".join(rnd.choice(chars) for _ in range(rnd.randint(0, 2))))
+        yield "".join(parts)
+
+def check_file(name: str, count: int = 20000) -> None:
+    path = os.path.join(ROOT, name)
+    rules = SCRename.load_replace_rules(path)
+    for text in random_inputs(path, count):
+        assert rules.apply(text) == replace_sequentially(path, text), text
+
+def test_rp1_matches_sequential_replace():
+    check_file("SCRename.rp1")
+
+def test_rp2_matches_sequential_replace():
+    check_file("SCRename.rp2")
+
+def test_chained_rules():
+    # 前の定義の置換結果に後の定義が一致する場合
+    path = os.path.join(ROOT, "SCRename.rp1")
+    text = "ＴＶ日5「アニメ「５"
+    assert SCRename.load_replace_rules(path).apply(text) == replace_sequentially(path, text)
+    rules = SCRename.ReplaceRules([("ab", "c"), ("cd", "x"), ("e", "f"), ("g", "h")])
+    assert rules.apply("abd eg") == "x fh"